@@ -0,0 +1,189 @@
+# app/aggregates.py
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import BigInteger, Integer, cast, func, select
+from sqlmodel import Session
+
+from .db import IS_SQLITE
+from .models import Measurement
+from .rollups import Accumulator, aggregate_rollup, to_epoch
+from . import coldstore
+
+BUCKETS = {
+    "1m": 60,
+    "5m": 5 * 60,
+    "1h": 60 * 60,
+    "1d": 24 * 60 * 60,
+}
+AGG_FUNCS = ("min", "max", "avg", "count", "first", "last")
+
+
+def epoch_seconds(column):
+    """Znacznik czasu jako liczba sekund od epoki, osobno dla SQLite i PostgreSQL."""
+    if IS_SQLITE:
+        return cast(func.strftime("%s", column), Integer)
+    return cast(func.floor(func.extract("epoch", column)), BigInteger)
+
+
+def bucket_expr(column, width: int):
+    return (epoch_seconds(column) // width) * width
+
+
+def parse_funcs(fn: str) -> List[str]:
+    funcs = [f.strip() for f in fn.split(",") if f.strip()]
+    unknown = [f for f in funcs if f not in AGG_FUNCS]
+    if unknown or not funcs:
+        raise ValueError(f"Unknown aggregate function(s): {', '.join(unknown) or fn}")
+    return funcs
+
+
+def aggregate_series(
+    session: Session,
+    series_id: int,
+    width: int,
+    funcs: List[str],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Dict[str, List[Any]]:
+    """Agregaty per przedział czasu, liczone w SQL (GROUP BY po kubełku)."""
+    if coldstore.has_blocks(session, [series_id], start, end):
+        return _aggregate_merged(session, series_id, width, funcs, start, end)
+    bucket = bucket_expr(Measurement.timestamp, width)
+    columns = [bucket.label("bucket"), Measurement.value.label("value")]
+    order = (Measurement.timestamp.asc(), Measurement.id.asc())
+    if "first" in funcs:
+        columns.append(
+            func.first_value(Measurement.value)
+            .over(partition_by=bucket, order_by=order)
+            .label("first_value")
+        )
+    if "last" in funcs:
+        columns.append(
+            func.last_value(Measurement.value)
+            .over(partition_by=bucket, order_by=order, rows=(None, None))
+            .label("last_value")
+        )
+
+    inner = select(*columns).where(Measurement.series_id == series_id)
+    if start is not None:
+        inner = inner.where(Measurement.timestamp >= start)
+    if end is not None:
+        inner = inner.where(Measurement.timestamp <= end)
+    sub = inner.subquery()
+
+    agg = {
+        "min": func.min(sub.c.value),
+        "max": func.max(sub.c.value),
+        "avg": func.avg(sub.c.value),
+        "count": func.count(),
+        "first": func.min(sub.c.first_value) if "first" in funcs else None,
+        "last": func.min(sub.c.last_value) if "last" in funcs else None,
+    }
+    stmt = (
+        select(sub.c.bucket, *(agg[f] for f in funcs))
+        .group_by(sub.c.bucket)
+        .order_by(sub.c.bucket)
+    )
+
+    result: Dict[str, List[Any]] = {"ts": []}
+    for f in funcs:
+        result[f] = []
+    for row in session.execute(stmt):
+        result["ts"].append(datetime.fromtimestamp(int(row[0]), timezone.utc))
+        for f, v in zip(funcs, row[1:]):
+            result[f].append(v)
+    return result
+
+
+def _aggregate_merged(
+    session: Session,
+    series_id: int,
+    width: int,
+    funcs: List[str],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Dict[str, List[Any]]:
+    """Jak aggregate_series, ale z odczytami z zimnych bloków. Blok leżący
+    w całości w zakresie i w jednym kubełku wnosi tylko swoje metadane."""
+    accs: Dict[int, Accumulator] = {}
+
+    def add(acc: Accumulator, epoch: float) -> None:
+        bucket = int(epoch // width) * width
+        if bucket in accs:
+            accs[bucket].merge(acc)
+        else:
+            accs[bucket] = acc
+
+    stmt = select(Measurement.timestamp, Measurement.value).where(Measurement.series_id == series_id)
+    if start is not None:
+        stmt = stmt.where(Measurement.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(Measurement.timestamp <= end)
+    for ts, value in session.execute(stmt.order_by(Measurement.timestamp, Measurement.id)):
+        epoch = to_epoch(ts)
+        add(Accumulator(epoch, value), epoch)
+
+    lo, hi = coldstore.naive_utc(start), coldstore.naive_utc(end)
+    for block in coldstore.blocks(session, [series_id], start, end):
+        first, last = to_epoch(block.start_ts), to_epoch(block.end_ts)
+        inside = (lo is None or block.start_ts >= lo) and (hi is None or block.end_ts <= hi)
+        if inside and first // width == last // width:
+            acc = Accumulator(first, block.first_value)
+            acc.count, acc.total = block.count, block.total
+            acc.min_value, acc.max_value = block.min_value, block.max_value
+            acc.last_ts, acc.last_value = last, block.last_value
+            add(acc, first)
+            continue
+        for ts, _id, _sid, value in coldstore.load(session, block.id):
+            if (lo is None or ts >= lo) and (hi is None or ts <= hi):
+                epoch = to_epoch(ts)
+                add(Accumulator(epoch, value), epoch)
+
+    values = {
+        "min": lambda a: a.min_value,
+        "max": lambda a: a.max_value,
+        "avg": lambda a: a.total / a.count,
+        "count": lambda a: a.count,
+        "first": lambda a: a.first_value,
+        "last": lambda a: a.last_value,
+    }
+    result: Dict[str, List[Any]] = {"ts": []}
+    for f in funcs:
+        result[f] = []
+    for bucket in sorted(accs):
+        result["ts"].append(datetime.fromtimestamp(bucket, timezone.utc))
+        for f in funcs:
+            result[f].append(values[f](accs[bucket]))
+    return result
+
+
+def aggregate(
+    session: Session,
+    series_id: int,
+    width: int,
+    funcs: List[str],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Dict[str, List[Any]]:
+    """Pełne kubełki z tabel rollup, niepełne kubełki na brzegach zakresu
+    z surowych pomiarów - wynik jest taki sam jak z aggregate_series."""
+    lo = None if start is None else math.ceil(to_epoch(start) / width) * width
+    hi = None if end is None else math.floor(to_epoch(end) / width) * width
+    if lo is not None and hi is not None and lo >= hi:
+        return aggregate_series(session, series_id, width, funcs, start, end)
+
+    parts = []
+    if start is not None and to_epoch(start) < lo:
+        edge = datetime.fromtimestamp(lo, timezone.utc) - timedelta(microseconds=1)
+        parts.append(aggregate_series(session, series_id, width, funcs, start, edge))
+    parts.append(aggregate_rollup(session, series_id, width, funcs, lo, hi))
+    if end is not None:
+        parts.append(aggregate_series(session, series_id, width, funcs, datetime.fromtimestamp(hi, timezone.utc), end))
+
+    result: Dict[str, List[Any]] = {key: [] for key in parts[0]}
+    for part in parts:
+        for key, values in part.items():
+            result[key].extend(values)
+    return result
@@ -1,7 +1,11 @@
 # app/auth.py
+import asyncio
+import hashlib
 import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any
+from typing import Any, Callable, Dict, Optional, Tuple
 
 from jose import jwt, JWTError
 from passlib.context import CryptContext
@@ -12,7 +16,17 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
 
 PEPPER = os.getenv("PASSWORD_PEPPER", "")
 
-pwd_context = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto")
+# koszt bcrypt (log2 rund); hasła z innym kosztem są przeliczane przy logowaniu
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "12"))
+# osobna pula dla bcrypt - logowania nie zajmują wątków obsługujących żądania
+PASSWORD_POOL = os.getenv("PASSWORD_POOL", "thread").lower()  # thread | process
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+# ile operacji może czekać na wolnego workera, zanim odpowiemy 503
+PASSWORD_QUEUE_MAX = int(os.getenv("PASSWORD_QUEUE_MAX", "16"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt_sha256"], deprecated="auto", bcrypt_sha256__rounds=PASSWORD_BCRYPT_ROUNDS
+)
 
 
 def _mix(pw: str) -> str:
@@ -27,6 +41,91 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(_mix(plain_password), hashed_password)
 
 
+def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(poprawne hasło, nowy hash albo None) - nowy hash, gdy needs_update."""
+    return pwd_context.verify_and_update(_mix(plain_password), hashed_password)
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+class PasswordPool:
+    """Ograniczona pula dla hashowania i weryfikacji haseł. Ponad
+    workers + queue_max oczekujących operacji od razu PasswordPoolBusy."""
+
+    def __init__(self, kind: str, workers: int, queue_max: int):
+        self.kind = kind
+        self.workers = workers
+        self.queue_max = queue_max
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        # tworzony leniwie - bez procesów potomnych przy samym imporcie
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        return self._executor
+
+    def _done(self, _: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        with self._lock:
+            if self._pending >= self.workers + self.queue_max:
+                self.rejected += 1
+                raise PasswordPoolBusy()
+            self._pending += 1
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except BaseException:
+                self._pending -= 1
+                raise
+        future.add_done_callback(self._done)
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Wersja dla synchronicznych endpointów i skryptów."""
+        return self.submit(fn, *args).result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "queue_max": self.queue_max,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "bcrypt_rounds": PASSWORD_BCRYPT_ROUNDS,
+            }
+
+
+password_pool = PasswordPool(PASSWORD_POOL, PASSWORD_WORKERS, PASSWORD_QUEUE_MAX)
+
+
+def credential_version(password_hash: str) -> str:
+    """Wersja poświadczeń zapisywana w tokenie; zmienia się razem z hasłem."""
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
+
+
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
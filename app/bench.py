@@ -0,0 +1,339 @@
+# app/bench.py
+# Generator obciążenia: N symulowanych sensorów (asyncio, wspólna pula
+# połączeń HTTP) plus ruch odczytów na GET /measurements i GET /series.
+# Raport (przepustowość, p50/p95/p99, histogram opóźnień per endpoint) w JSON.
+#
+#   python -m app.bench --serve --sensors 2000 --rate 0.2 --duration 60 --out bench.json
+#
+# --serve uruchamia lokalny uvicorn na jednorazowym pliku SQLite; bez niego
+# test idzie na --url (konto admina potrzebne do założenia serii i sensorów).
+# Tryby nadawania (--pattern):
+# - uniform: każdy sensor z losową fazą, średnio --rate odczytów/s,
+# - aligned: wszystkie sensory w tej samej chwili (thundering herd),
+# - burst: jak uniform, a co --burst-every s każdy sensor wysyła --burst-size paczek naraz.
+# Opóźnienie liczone od zaplanowanej chwili wysłania, nie od faktycznej -
+# przeciążony serwer nie zaniża w ten sposób własnych percentyli.
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# górne granice kubełków histogramu w ms
+HISTOGRAM_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.readings = 0
+
+    def record(self, latency_ms: float, status: str, readings: int = 0) -> None:
+        self.latencies.append(latency_ms)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status.startswith("2"):
+            self.readings += readings
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        lat = sorted(self.latencies)
+        n = len(lat)
+        ok = sum(c for s, c in self.statuses.items() if s.startswith("2"))
+
+        def pct(p: float) -> Optional[float]:
+            return round(lat[min(int(p / 100 * n), n - 1)], 3) if n else None
+
+        histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        for value in lat:
+            histogram[bisect_left(HISTOGRAM_BOUNDS_MS, value)] += 1
+        return {
+            "requests": n,
+            "ok": ok,
+            "errors": n - ok,
+            "statuses": dict(sorted(self.statuses.items())),
+            "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+            "readings_per_s": round(self.readings / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "mean": round(sum(lat) / n, 3) if n else None,
+                "p50": pct(50),
+                "p95": pct(95),
+                "p99": pct(99),
+                "max": round(lat[-1], 3) if n else None,
+            },
+            "histogram_ms": {
+                **{f"le_{b}": c for b, c in zip(HISTOGRAM_BOUNDS_MS, histogram)},
+                "inf": histogram[-1],
+            },
+        }
+
+
+class Bench:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.stats: Dict[str, EndpointStats] = {}
+        self.series_ids: List[int] = []
+        self.sensor_keys: List[str] = []
+        self.rng = random.Random(args.seed)
+
+    def _stats(self, name: str) -> EndpointStats:
+        if name not in self.stats:
+            self.stats[name] = EndpointStats()
+        return self.stats[name]
+
+    async def _request(
+        self,
+        client: httpx.AsyncClient,
+        name: str,
+        scheduled: float,
+        method: str,
+        url: str,
+        readings: int = 0,
+        **kwargs: Any,
+    ) -> None:
+        try:
+            resp = await client.request(method, url, **kwargs)
+            status = str(resp.status_code)
+        except httpx.HTTPError as exc:
+            status = type(exc).__name__
+        self._stats(name).record((time.perf_counter() - scheduled) * 1000, status, readings)
+
+    # --- przygotowanie ---
+
+    async def setup(self, client: httpx.AsyncClient) -> None:
+        a = self.args
+        resp = await client.post("/auth/login", json={"username": a.admin_user, "password": a.admin_password})
+        resp.raise_for_status()
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        for i in range(a.series):
+            resp = await client.post(
+                "/series",
+                json={"name": f"bench-{stamp}-{i}", "min_value": 0.0, "max_value": 100.0},
+                headers=headers,
+            )
+            resp.raise_for_status()
+            self.series_ids.append(resp.json()["id"])
+
+        sem = asyncio.Semaphore(a.connections)
+
+        async def create_sensor(i: int) -> str:
+            async with sem:
+                resp = await client.post(
+                    "/sensors",
+                    json={"name": f"bench-{stamp}-{i}", "series_id": self.series_ids[i % len(self.series_ids)]},
+                    headers=headers,
+                )
+                resp.raise_for_status()
+                return resp.json()["api_key"]
+
+        self.sensor_keys = await asyncio.gather(*(create_sensor(i) for i in range(a.sensors)))
+
+    # --- ruch ---
+
+    def _payload(self) -> Any:
+        def reading() -> Dict[str, Any]:
+            return {"value": round(self.rng.uniform(20.0, 25.0), 2)}
+
+        if self.args.batch > 1:
+            return [reading() for _ in range(self.args.batch)]
+        return reading()
+
+    async def _send(self, client: httpx.AsyncClient, key: str, scheduled: float) -> None:
+        payload = self._payload()
+        if self.args.batch > 1:
+            name, url, readings = "POST /measurements/from-sensor/batch", "/measurements/from-sensor/batch", len(payload)
+        else:
+            name, url, readings = "POST /measurements/from-sensor", "/measurements/from-sensor", 1
+        await self._request(client, name, scheduled, "POST", url, readings, json=payload, headers={"X-Sensor-Key": key})
+
+    async def sensor(self, client: httpx.AsyncClient, key: str, start: float, stop: float) -> None:
+        a = self.args
+        interval = 1.0 / a.rate
+        phase = 0.0 if a.pattern == "aligned" else self.rng.uniform(0, interval)
+        next_at = start + phase
+        next_burst = start + a.burst_every if a.pattern == "burst" and a.burst_every > 0 else None
+        pending: List[asyncio.Task] = []
+        while True:
+            if next_burst is not None and next_burst <= next_at:
+                at, count = next_burst, a.burst_size
+                next_burst += a.burst_every
+            else:
+                at, count = next_at, 1
+                next_at += interval
+            if at >= stop:
+                break
+            await asyncio.sleep(max(at - time.perf_counter(), 0))
+            # żądania nie czekają na siebie - wolny serwer nie spowalnia harmonogramu
+            pending += [asyncio.create_task(self._send(client, key, at)) for _ in range(count)]
+            pending = [t for t in pending if not t.done()]
+        await asyncio.gather(*pending)
+
+    async def reader(self, client: httpx.AsyncClient, start: float, stop: float) -> None:
+        a = self.args
+        interval = 1.0 / a.read_rate
+        next_at = start + self.rng.uniform(0, interval)
+        pending: List[asyncio.Task] = []
+        while next_at < stop:
+            await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+            if self.rng.random() < a.read_mix:
+                params = {"series_id": self.rng.choice(self.series_ids), "limit": a.read_limit}
+                task = self._request(client, "GET /measurements", next_at, "GET", "/measurements", params=params)
+            else:
+                task = self._request(client, "GET /series", next_at, "GET", "/series")
+            pending.append(asyncio.create_task(task))
+            pending = [t for t in pending if not t.done()]
+            next_at += interval
+        await asyncio.gather(*pending)
+
+    async def run(self, base_url: str) -> Dict[str, Any]:
+        a = self.args
+        limits = httpx.Limits(max_connections=a.connections, max_keepalive_connections=a.connections)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=a.timeout) as client:
+            await self.setup(client)
+            start = time.perf_counter()
+            stop = start + a.duration
+            tasks = [self.sensor(client, key, start, stop) for key in self.sensor_keys]
+            tasks += [self.reader(client, start, stop) for _ in range(a.readers)]
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+        return self.report(base_url, elapsed)
+
+    def report(self, base_url: str, elapsed: float) -> Dict[str, Any]:
+        endpoints = {name: s.report(elapsed) for name, s in sorted(self.stats.items())}
+        return {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "build": _git_revision(),
+            "url": base_url,
+            "config": {k: v for k, v in vars(self.args).items() if k != "admin_password"},
+            "elapsed_s": round(elapsed, 3),
+            "total": {
+                "requests": sum(e["requests"] for e in endpoints.values()),
+                "throughput_rps": round(sum(e["throughput_rps"] for e in endpoints.values()), 2),
+                "readings_per_s": round(sum(e["readings_per_s"] for e in endpoints.values()), 2),
+            },
+            "endpoints": endpoints,
+        }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class LocalServer:
+    """uvicorn app.main:app na jednorazowej bazie SQLite (z seedem)."""
+
+    def __init__(self, port: int, extra_env: Dict[str, str]):
+        self.port = port
+        self.tmpdir = tempfile.TemporaryDirectory(prefix="bench-")
+        self.env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{self.tmpdir.name}/bench.sqlite",
+            **extra_env,
+        }
+        self.proc: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "LocalServer":
+        subprocess.run([sys.executable, "-m", "app.seed"], env=self.env, check=True, stdout=subprocess.DEVNULL)
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port), "--log-level", "warning"],
+            env=self.env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {self.proc.returncode}")
+            try:
+                if httpx.get(f"{self.url}/openapi.json", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError("uvicorn did not start within 30 s")
+
+    def __exit__(self, *exc: Any) -> None:
+        if self.proc is not None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.tmpdir.cleanup()
+
+
+def _env_pair(value: str) -> tuple:
+    name, sep, val = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError("expected NAME=VALUE")
+    return name, val
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Test obciążeniowy: symulowane sensory i odczyty")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--serve", action="store_true", help="uruchom lokalny uvicorn na jednorazowej bazie")
+    parser.add_argument("--port", type=int, default=8765, help="port dla --serve")
+    parser.add_argument("--server-env", type=_env_pair, action="append", default=[], metavar="NAME=VALUE",
+                        help="zmienna środowiskowa serwera dla --serve (można powtarzać)")
+    parser.add_argument("--admin-user", default="admin")
+    parser.add_argument("--admin-password", default="admin123")
+    parser.add_argument("--sensors", type=int, default=100)
+    parser.add_argument("--series", type=int, default=4, help="serie, między które rozkładane są sensory")
+    parser.add_argument("--rate", type=float, default=0.2, help="żądań zapisu na sensor na sekundę")
+    parser.add_argument("--batch", type=int, default=1, help="odczytów w żądaniu; >1 = /from-sensor/batch")
+    parser.add_argument("--pattern", choices=["uniform", "aligned", "burst"], default="uniform")
+    parser.add_argument("--burst-every", type=float, default=10.0)
+    parser.add_argument("--burst-size", type=int, default=5)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--read-rate", type=float, default=5.0, help="żądań odczytu na czytelnika na sekundę")
+    parser.add_argument("--read-mix", type=float, default=0.8, help="udział GET /measurements w odczytach")
+    parser.add_argument("--read-limit", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None, help="plik raportu JSON (domyślnie stdout)")
+    args = parser.parse_args()
+    if args.rate <= 0 or args.read_rate <= 0 or args.sensors < 0 or args.series < 1:
+        parser.error("--rate and --read-rate must be > 0, --series >= 1")
+
+    bench = Bench(args)
+    if args.serve:
+        with LocalServer(args.port, dict(args.server_env)) as server:
+            report = asyncio.run(bench.run(server.url))
+    else:
+        report = asyncio.run(bench.run(args.url))
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        summary = ", ".join(
+            f"{name}: {e['throughput_rps']} rps p99={e['latency_ms']['p99']} ms"
+            for name, e in report["endpoints"].items()
+        )
+        print(f"Report written to {args.out} ({summary})")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
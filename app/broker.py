@@ -0,0 +1,99 @@
+# app/broker.py
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+
+BROKER_QUEUE_SIZE = int(os.getenv("BROKER_QUEUE_SIZE", "256"))
+BROKER_REPLAY = int(os.getenv("BROKER_REPLAY", "100"))
+
+# co zrobić z wolnym odbiorcą, gdy jego kolejka jest pełna
+POLICIES = ("drop_oldest", "latest")
+
+
+class Subscription:
+    def __init__(self, series_id: int, maxsize: int, policy: str):
+        self.series_id = series_id
+        self.policy = policy
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, reading: Dict[str, Any]) -> None:
+        if self.policy == "latest":
+            # zostaje tylko najnowszy odczyt - odbiorca dostaje bieżącą wartość
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+        elif self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(reading)
+
+
+class Broker:
+    """Pub/sub w obrębie procesu: ścieżki zapisu publikują zatwierdzone odczyty,
+    strumienie SSE/WebSocket je odbierają."""
+
+    def __init__(self, replay_size: int):
+        self.replay_size = replay_size
+        self._subs: Dict[int, Set[Subscription]] = {}
+        self._replay: Dict[int, Deque[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+
+    def publish(self, readings: Iterable[Dict[str, Any]]) -> None:
+        """Bezpieczne do wywołania z dowolnego wątku, po commicie."""
+        readings = list(readings)
+        if not readings:
+            return
+        with self._lock:
+            self.published += len(readings)
+            if self.replay_size:
+                for r in readings:
+                    buf = self._replay.setdefault(r["series_id"], deque(maxlen=self.replay_size))
+                    buf.append(r)
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._deliver, readings)
+
+    def _deliver(self, readings: List[Dict[str, Any]]) -> None:
+        for r in readings:
+            for sub in self._subs.get(r["series_id"], ()):
+                sub.offer(r)
+
+    def subscribe(self, series_id: int, replay: int = 0, policy: str = "drop_oldest") -> Subscription:
+        """Wywoływać z pętli zdarzeń; replay - ile ostatnich odczytów wysłać na start."""
+        self._loop = asyncio.get_running_loop()
+        sub = Subscription(series_id, BROKER_QUEUE_SIZE, policy)
+        if replay:
+            with self._lock:
+                backlog = list(self._replay.get(series_id, ()))[-replay:]
+            for r in backlog:
+                sub.offer(r)
+        self._subs.setdefault(series_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self._subs.get(sub.series_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subs[sub.series_id]
+
+    def forget_series(self, series_id: int) -> None:
+        with self._lock:
+            self._replay.pop(series_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "published": self.published,
+            "subscribers": {sid: len(subs) for sid, subs in self._subs.items()},
+            "dropped": sum(s.dropped for subs in self._subs.values() for s in subs),
+            "replay_size": self.replay_size,
+            "queue_size": BROKER_QUEUE_SIZE,
+        }
+
+
+broker = Broker(BROKER_REPLAY)
@@ -0,0 +1,299 @@
+# app/coldstore.py
+# Zimna warstwa pomiarów: stare odczyty serii są zamykane w bloki
+# (measurement_block) kodowane przez app/gorilla.py. Listowanie, eksport
+# i agregaty scalają je z gorącą tabelą measurement; zmiana lub usunięcie
+# odczytu po id najpierw przenosi go z bloku z powrotem do tej tabeli.
+import argparse
+import heapq
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlmodel import Session
+
+from .db import engine, init_db
+from .models import Measurement, MeasurementBlock, Series
+from . import gorilla
+
+# pomiary starsze niż tyle dni trafiają do bloków; 0 = wyłączone
+COLD_AFTER_DAYS = float(os.getenv("COLD_AFTER_DAYS", "0"))
+COLD_BLOCK_SECONDS = int(os.getenv("COLD_BLOCK_SECONDS", str(24 * 60 * 60)))
+COLD_BLOCK_MAX_ROWS = int(os.getenv("COLD_BLOCK_MAX_ROWS", "4096"))
+
+# (timestamp, id, series_id, value) - kolejność krotek to kolejność odczytów
+Cold = Tuple[datetime, int, int, float]
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def naive_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    """Znaczniki czasu w bazie są bez strefy (UTC) - tak też porównujemy."""
+    if ts is None or ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_micros(ts: datetime) -> int:
+    d = naive_utc(ts) - _EPOCH
+    return (d.days * 86400 + d.seconds) * 1_000_000 + d.microseconds
+
+
+def from_micros(us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=us)
+
+
+def sealing_cutoff(now: datetime, days: float = COLD_AFTER_DAYS) -> datetime:
+    """Granica zamykania bloków, wyrównana do COLD_BLOCK_SECONDS."""
+    width = COLD_BLOCK_SECONDS * 1_000_000
+    return from_micros(to_micros(now - timedelta(days=days)) // width * width)
+
+
+def block_filters(series_ids: Optional[Sequence[int]], start: Optional[datetime], end: Optional[datetime]) -> list:
+    filters = []
+    if series_ids is not None:
+        filters.append(MeasurementBlock.series_id.in_(series_ids))
+    if start is not None:
+        filters.append(MeasurementBlock.end_ts >= naive_utc(start))
+    if end is not None:
+        filters.append(MeasurementBlock.start_ts <= naive_utc(end))
+    return filters
+
+
+def blocks(conn, series_ids: Optional[Sequence[int]], start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Metadane bloków nachodzących na [start, end], bez danych, po start_ts."""
+    b = MeasurementBlock
+    return conn.execute(
+        select(
+            b.id, b.series_id, b.start_ts, b.end_ts, b.count, b.total,
+            b.min_value, b.max_value, b.first_value, b.last_value,
+        )
+        .where(*block_filters(series_ids, start, end))
+        .order_by(b.start_ts, b.id)
+    ).all()
+
+
+def has_blocks(conn, series_ids: Optional[Sequence[int]], start: Optional[datetime] = None, end: Optional[datetime] = None) -> bool:
+    stmt = select(MeasurementBlock.id).where(*block_filters(series_ids, start, end)).limit(1)
+    return conn.execute(stmt).first() is not None
+
+
+def load(conn, block_id: int) -> List[Cold]:
+    series_id, data = conn.execute(
+        select(MeasurementBlock.series_id, MeasurementBlock.data).where(MeasurementBlock.id == block_id)
+    ).one()
+    ids, stamps, values = gorilla.decode(data)
+    return [(from_micros(ts), mid, series_id, value) for mid, ts, value in zip(ids, stamps, values)]
+
+
+def iter_readings(
+    conn,
+    series_ids: Optional[Sequence[int]],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+) -> Iterator[Cold]:
+    """Odczyty z bloków w [start, end] (i po kursorze after), posortowane
+    po (timestamp, id). Bloki są dekodowane dopiero, gdy są potrzebne."""
+    start, end = naive_utc(start), naive_utc(end)
+    after_key = None if after is None else (naive_utc(after[0]), after[1])
+    lo = start
+    if after_key is not None and (lo is None or after_key[0] > lo):
+        lo = after_key[0]
+
+    pending: List[Cold] = []
+    for block in blocks(conn, series_ids, lo, end):
+        # bloki są posortowane po start_ts - wcześniejsze odczyty są już pewne
+        while pending and pending[0][0] < block.start_ts:
+            yield heapq.heappop(pending)
+        for r in load(conn, block.id):
+            if start is not None and r[0] < start:
+                continue
+            if end is not None and r[0] > end:
+                continue
+            if after_key is not None and (r[0], r[1]) <= after_key:
+                continue
+            heapq.heappush(pending, r)
+    while pending:
+        yield heapq.heappop(pending)
+
+
+def merge(hot: Iterable[Any], cold: Iterable[Cold]) -> Iterator[Any]:
+    """Scala gorące wiersze (timestamp, id, ...) z odczytami z bloków."""
+    return heapq.merge(hot, cold, key=lambda r: (r[0], r[1]))
+
+
+def range_stats(conn, series_id: int, start: Optional[datetime], end: Optional[datetime]):
+    """(liczba, pierwszy, ostatni znacznik czasu) odczytów z bloków w zakresie;
+    bloki leżące w całości w zakresie liczone są z samych metadanych."""
+    start, end = naive_utc(start), naive_utc(end)
+    count, first, last = 0, None, None
+    for block in blocks(conn, [series_id], start, end):
+        if (start is None or block.start_ts >= start) and (end is None or block.end_ts <= end):
+            n, lo, hi = block.count, block.start_ts, block.end_ts
+        else:
+            stamps = [
+                r[0] for r in load(conn, block.id)
+                if (start is None or r[0] >= start) and (end is None or r[0] <= end)
+            ]
+            if not stamps:
+                continue
+            n, lo, hi = len(stamps), stamps[0], stamps[-1]
+        count += n
+        first = lo if first is None else min(first, lo)
+        last = hi if last is None else max(last, hi)
+    return count, first, last
+
+
+def latest(conn, series_id: int) -> Optional[Cold]:
+    block_id = conn.execute(
+        select(MeasurementBlock.id)
+        .where(MeasurementBlock.series_id == series_id)
+        .order_by(MeasurementBlock.end_ts.desc(), MeasurementBlock.id.desc())
+        .limit(1)
+    ).scalar()
+    if block_id is None:
+        return None
+    return max(load(conn, block_id))
+
+
+def _make_block(series_id: int, readings: List[Cold]) -> MeasurementBlock:
+    values = [r[3] for r in readings]
+    return MeasurementBlock(
+        series_id=series_id,
+        start_ts=readings[0][0],
+        end_ts=readings[-1][0],
+        count=len(readings),
+        total=sum(values),
+        min_value=min(values),
+        max_value=max(values),
+        first_value=values[0],
+        last_value=values[-1],
+        min_id=min(r[1] for r in readings),
+        max_id=max(r[1] for r in readings),
+        data=gorilla.encode([r[1] for r in readings], [to_micros(r[0]) for r in readings], values),
+    )
+
+
+def seal_window(session: Session, series_id: int, cutoff: datetime) -> int:
+    """Zamyka w jeden blok najstarsze gorące pomiary serii sprzed cutoff
+    (jedno okno COLD_BLOCK_SECONDS, najwyżej COLD_BLOCK_MAX_ROWS wierszy).
+    Zwraca liczbę przeniesionych wierszy; commit po stronie wywołującego."""
+    cutoff = naive_utc(cutoff)
+    oldest = session.scalar(
+        select(func.min(Measurement.timestamp)).where(
+            Measurement.series_id == series_id, Measurement.timestamp < cutoff
+        )
+    )
+    if oldest is None:
+        return 0
+    width = COLD_BLOCK_SECONDS * 1_000_000
+    window_end = min(from_micros(to_micros(oldest) // width * width + width), cutoff)
+    rows = session.execute(
+        select(Measurement.timestamp, Measurement.id, Measurement.series_id, Measurement.value)
+        .where(
+            Measurement.series_id == series_id,
+            Measurement.timestamp >= oldest,
+            Measurement.timestamp < window_end,
+        )
+        .order_by(Measurement.timestamp, Measurement.id)
+        .limit(COLD_BLOCK_MAX_ROWS)
+    ).all()
+    session.add(_make_block(series_id, [tuple(r) for r in rows]))
+    session.execute(
+        delete(Measurement)
+        .where(Measurement.id.in_([r[1] for r in rows]))
+        .execution_options(synchronize_session=False)
+    )
+    return len(rows)
+
+
+def find(conn, measurement_id: int) -> Optional[Tuple[int, List[Cold]]]:
+    """(id bloku, jego odczyty) dla bloku zawierającego pomiar albo None."""
+    b = MeasurementBlock
+    candidates = conn.execute(
+        select(b.id).where(b.min_id <= measurement_id, b.max_id >= measurement_id)
+    ).scalars().all()
+    for block_id in candidates:
+        readings = load(conn, block_id)
+        if any(r[1] == measurement_id for r in readings):
+            return block_id, readings
+    return None
+
+
+def unseal(session: Session, measurement_id: int) -> Optional[Measurement]:
+    """Przenosi odczyt z bloku do gorącej tabeli (z tym samym id), żeby dało
+    się go zmienić lub usunąć; blok jest kodowany na nowo bez niego. Zwraca
+    pomiar albo None, gdy żaden blok go nie zawiera; commit po stronie
+    wywołującego."""
+    found = find(session, measurement_id)
+    if found is None:
+        return None
+    block_id, readings = found
+    ts, _, series_id, value = next(r for r in readings if r[1] == measurement_id)
+    keep = [r for r in readings if r[1] != measurement_id]
+    session.execute(delete(MeasurementBlock).where(MeasurementBlock.id == block_id))
+    if keep:
+        session.add(_make_block(series_id, keep))
+    obj = Measurement(id=measurement_id, series_id=series_id, value=value, timestamp=ts)
+    session.add(obj)
+    session.flush()
+    return obj
+
+
+def prune(session: Session, series_id: int, ts: datetime) -> int:
+    """Usuwa z bloków odczyty serii do ts włącznie (retencja); blok na granicy
+    jest kodowany na nowo z pozostałych odczytów. Zwraca liczbę usuniętych."""
+    ts = naive_utc(ts)
+    removed = 0
+    for block in blocks(session, [series_id], None, ts):
+        keep = [] if block.end_ts <= ts else [r for r in load(session, block.id) if r[0] > ts]
+        removed += block.count - len(keep)
+        session.execute(delete(MeasurementBlock).where(MeasurementBlock.id == block.id))
+        if keep:
+            session.add(_make_block(series_id, keep))
+    return removed
+
+
+def stats(conn) -> Dict[str, Any]:
+    b = MeasurementBlock
+    blocks_count, rows, size = conn.execute(
+        select(func.count(b.id), func.coalesce(func.sum(b.count), 0), func.coalesce(func.sum(func.length(b.data)), 0))
+    ).one()
+    return {
+        "cold_after_days": COLD_AFTER_DAYS,
+        "block_seconds": COLD_BLOCK_SECONDS,
+        "block_max_rows": COLD_BLOCK_MAX_ROWS,
+        "blocks": blocks_count,
+        "rows": rows,
+        "bytes": size,
+        "bytes_per_row": size / rows if rows else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Zamykanie starych pomiarów w skompresowane bloki")
+    parser.add_argument("command", choices=["seal"])
+    parser.add_argument("--older-than-days", type=float, default=COLD_AFTER_DAYS)
+    parser.add_argument("--series", type=int, default=None, help="tylko wskazana seria")
+    args = parser.parse_args()
+    if args.older_than_days <= 0:
+        parser.error("--older-than-days (lub COLD_AFTER_DAYS) musi być > 0")
+
+    init_db()
+    cutoff = sealing_cutoff(datetime.now(timezone.utc), args.older_than_days)
+    total = 0
+    with Session(engine) as session:
+        series_ids = [args.series] if args.series is not None else session.scalars(select(Series.id)).all()
+        for series_id in series_ids:
+            while True:
+                sealed = seal_window(session, series_id, cutoff)
+                session.commit()
+                if not sealed:
+                    break
+                total += sealed
+    print(f"Sealed {total} measurements older than {cutoff.isoformat()}.")
+
+
+if __name__ == "__main__":
+    main()
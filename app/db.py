@@ -1,27 +1,186 @@
 from sqlmodel import SQLModel, create_engine, Session
-from sqlalchemy import event
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import await_only
+import asyncio
 import os
+import threading
 from dotenv import load_dotenv
 
+from .migrations import run_migrations
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./db.sqlite")
+# opcjonalna replika do odczytów (PostgreSQL)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
 IS_SQLITE = DATABASE_URL.startswith("sqlite")
 connect_args = {"check_same_thread": False} if IS_SQLITE else {}
-engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args)
 
-if IS_SQLITE:
-    @event.listens_for(engine, "connect")
-    def _set_sqlite_pragma(dbapi_connection, connection_record):
-        cursor = dbapi_connection.cursor()
-        try:
-            cursor.execute("PRAGMA foreign_keys=ON")
-        finally:
-            cursor.close()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+
+# "default" - tylko foreign_keys; "performance" - WAL, strojone pragmy
+# i osobne połączenia: jedno do zapisu, pula tylko-do-odczytu dla GET.
+# Silnik synchroniczny i asynchroniczny mają po jednym połączeniu do zapisu,
+# ale wspólna blokada (_writer_lock) sprawia, że naraz pisze tylko jedno z nich
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "default").lower()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # ujemne = KiB
+
+_sqlite_file = IS_SQLITE and make_url(DATABASE_URL).database not in (None, "", ":memory:")
+SQLITE_PERFORMANCE = IS_SQLITE and SQLITE_PROFILE == "performance" and _sqlite_file
+
+
+def _sqlite_pragmas(read_only: bool) -> list[str]:
+    pragmas = ["PRAGMA foreign_keys=ON"]
+    if not SQLITE_PERFORMANCE:
+        return pragmas
+    if not read_only:
+        pragmas.append("PRAGMA journal_mode=WAL")
+    pragmas += [
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+# wydawana przy pobraniu połączenia do zapisu z puli, zwalniana przy oddaniu
+_writer_lock = threading.Lock()
+
+
+def _acquire_writer() -> None:
+    if not _writer_lock.acquire(timeout=DB_POOL_TIMEOUT):
+        raise exc.TimeoutError(f"SQLite writer busy for {DB_POOL_TIMEOUT}s")
+
+
+def _acquire_writer_async() -> None:
+    # w pętli zdarzeń czekamy w wątku puli, żeby nie blokować innych żądań;
+    # przerwane czekanie zwalnia blokadę, jeśli wątek zdąży ją mimo to zdobyć
+    fut = asyncio.get_running_loop().run_in_executor(None, _acquire_writer)
+    try:
+        await_only(asyncio.shield(fut))
+    except BaseException:
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception() or _writer_lock.release())
+        raise
+
+
+def _serialize_writer(eng, use_async: bool) -> None:
+    acquire = _acquire_writer_async if use_async else _acquire_writer
+
+    @event.listens_for(eng, "checkout")
+    def _writer_checkout(dbapi_connection, connection_record, connection_proxy):
+        acquire()
+        connection_record.info["writer_lock"] = True
+
+    @event.listens_for(eng, "checkin")
+    def _writer_checkin(dbapi_connection, connection_record):
+        if connection_record.info.pop("writer_lock", False):
+            _writer_lock.release()
+
+
+def _async_url(url: str) -> str:
+    """sqlite:// -> sqlite+aiosqlite://, postgresql:// -> postgresql+asyncpg://"""
+    u = make_url(url)
+    driver = "aiosqlite" if u.get_backend_name() == "sqlite" else "asyncpg"
+    return u.set(drivername=f"{u.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+def _make_engine(url: str, read_only: bool = False, use_async: bool = False, writer_lock: bool = True):
+    kwargs = {}
+    if not IS_SQLITE or _sqlite_file:
+        kwargs = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+        }
+    if SQLITE_PERFORMANCE and not read_only:
+        # SQLite i tak serializuje zapisy - jeden writer zamiast walki o blokadę;
+        # wspólny dla silnika sync i async, patrz _serialize_writer
+        kwargs.update(pool_size=1, max_overflow=0)
+    if use_async:
+        if IS_SQLITE and _sqlite_file:
+            # aiosqlite domyślnie używa NullPool (nowe połączenie na żądanie)
+            kwargs["poolclass"] = AsyncAdaptedQueuePool
+        eng = create_async_engine(_async_url(url), echo=False, connect_args=connect_args, **kwargs)
+    else:
+        eng = create_engine(url, echo=False, connect_args=connect_args, **kwargs)
+
+    if IS_SQLITE:
+        pragmas = _sqlite_pragmas(read_only)
+
+        @event.listens_for(eng.sync_engine if use_async else eng, "connect")
+        def _set_sqlite_pragma(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+    if SQLITE_PERFORMANCE and not read_only and writer_lock:
+        _serialize_writer(eng.sync_engine if use_async else eng, use_async)
+    return eng
+
+
+engine = _make_engine(DATABASE_URL)
+if SQLITE_PERFORMANCE:
+    read_engine = _make_engine(DATABASE_URL, read_only=True)
+elif DATABASE_READ_URL and not IS_SQLITE:
+    read_engine = _make_engine(DATABASE_READ_URL, read_only=True)
+else:
+    read_engine = engine
+
+# silniki asynchroniczne (aiosqlite / asyncpg) dla gorących endpointów
+async_engine = _make_engine(DATABASE_URL, use_async=True)
+if SQLITE_PERFORMANCE:
+    async_read_engine = _make_engine(DATABASE_URL, read_only=True, use_async=True)
+elif DATABASE_READ_URL and not IS_SQLITE:
+    async_read_engine = _make_engine(DATABASE_READ_URL, read_only=True, use_async=True)
+else:
+    async_read_engine = async_engine
+
+# limiter w bazie (app/ratelimit.py) pisze własnym połączeniem, poza _writer_lock:
+# jego UPSERT na każde żądanie sensora nie staje w kolejce z zapisami grupowymi
+ratelimit_engine = _make_engine(DATABASE_URL, writer_lock=False) if SQLITE_PERFORMANCE else engine
+
+def all_engines() -> list:
+    """Wszystkie różne silniki synchroniczne (dla asynchronicznych - ich sync_engine)."""
+    engines = []
+    for eng in (engine, read_engine, async_engine.sync_engine, async_read_engine.sync_engine, ratelimit_engine):
+        if not any(eng is e for e in engines):
+            engines.append(eng)
+    return engines
 
 def init_db():
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+def get_read_session():
+    with Session(read_engine) as session:
+        yield session
+
+async def get_async_session():
+    async with AsyncSession(async_engine) as session:
+        yield session
+
+async def get_async_read_session():
+    async with AsyncSession(async_read_engine) as session:
+        yield session
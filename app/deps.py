@@ -1,51 +1,163 @@
+import os
+import time
+from typing import Any, Dict, NamedTuple
+
 from fastapi import Depends, HTTPException, status, Header
 from fastapi.security import OAuth2PasswordBearer
 from sqlmodel import Session, select
-from .db import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .db import async_read_engine, get_read_session, read_engine
 from .models import User, Sensor
-from .auth import decode_token
+from .auth import decode_token, credential_version
+from .cache import TTLCache
+from .ratelimit import sensor_limiter
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
+SENSOR_CACHE_SIZE = int(os.getenv("SENSOR_CACHE_SIZE", "10000"))
+SENSOR_CACHE_TTL = float(os.getenv("SENSOR_CACHE_TTL", "300"))
+SENSOR_CACHE_NEGATIVE_TTL = float(os.getenv("SENSOR_CACHE_NEGATIVE_TTL", "5"))
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    session: Session = Depends(get_session),
-) -> User:
-    credentials_exception = HTTPException(
+# Tryb bezstanowy: require_admin ufa zweryfikowanym claimom tokenu, a wersję
+# poświadczeń użytkownika sprawdza w małym cache zamiast w bazie.
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "0").lower() in ("1", "true", "yes")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
+
+class SensorIdentity(NamedTuple):
+    id: int
+    series_id: int
+
+
+# api_key -> SensorIdentity, albo None dla nieznanych kluczy (krótszy TTL)
+sensor_key_cache = TTLCache(SENSOR_CACHE_SIZE, SENSOR_CACHE_TTL)
+_NOT_CACHED = object()
+
+
+def invalidate_sensor_key(api_key: str) -> None:
+    sensor_key_cache.invalidate(api_key)
+
+
+def invalidate_series_sensors(series_id: int) -> None:
+    sensor_key_cache.invalidate_where(
+        lambda _, ident: ident is not None and ident.series_id == series_id
+    )
+
+
+class Principal(NamedTuple):
+    id: int
+    username: str
+    role: str
+
+
+class _UserVersion(NamedTuple):
+    username: str
+    role: str
+    version: str
+
+
+# token -> zdekodowany payload, do końca ważności tokenu
+token_cache = TTLCache(TOKEN_CACHE_SIZE, 0)
+# user id -> _UserVersion
+user_version_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def invalidate_user(user_id: int) -> None:
+    user_version_cache.invalidate(user_id)
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _decode_cached(token: str) -> Dict[str, Any]:
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = decode_token(token)
-        username: str | None = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except Exception:
-        raise credentials_exception
-    user = session.exec(select(User).where(User.username == username)).first()
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    remaining = payload.get("exp", 0) - time.time()
+    if remaining > 0:
+        token_cache.set(token, payload, ttl=remaining)
+    return payload
+
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    session: Session = Depends(get_read_session),
+) -> User:
+    payload = _decode_cached(token)
+    user = session.exec(select(User).where(User.username == payload["sub"])).first()
     if not user:
-        raise credentials_exception
+        raise _credentials_exception()
+    if "ver" in payload and payload["ver"] != credential_version(user.password_hash):
+        raise _credentials_exception()
     return user
 
 
-def require_admin(user: User = Depends(get_current_user)) -> User:
-    if user.role != "admin":
+def _user_version(session: Session, user_id: int) -> _UserVersion | None:
+    cached = user_version_cache.get(user_id)
+    if cached is not None:
+        return cached
+    user = session.get(User, user_id)
+    if not user:
+        return None
+    cached = _UserVersion(user.username, user.role, credential_version(user.password_hash))
+    user_version_cache.set(user_id, cached)
+    return cached
+
+
+def get_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    # krótka sesja zamiast zależności: połączenie wraca do puli przed
+    # wykonaniem handlera, więc żądanie nie trzyma dwóch połączeń naraz
+    if not AUTH_STATELESS or "uid" not in _decode_cached(token):
+        with Session(read_engine) as session:
+            user = get_current_user(token, session)
+            return Principal(user.id, user.username, user.role)
+    payload = _decode_cached(token)
+    with Session(read_engine) as session:
+        current = _user_version(session, payload["uid"])
+    if current is None or current.version != payload.get("ver"):
+        raise _credentials_exception()
+    return Principal(payload["uid"], current.username, current.role)
+
+
+def require_admin(principal: Principal = Depends(get_principal)) -> Principal:
+    if principal.role != "admin":
         raise HTTPException(status_code=403, detail="Admin privileges required")
-    return user
+    return principal
 
 
-def get_sensor(
+async def get_sensor(
     x_sensor_key: str = Header(..., alias="X-Sensor-Key"),
-    session: Session = Depends(get_session),
-) -> Sensor:
-    sensor = session.exec(
-        select(Sensor).where(Sensor.api_key == x_sensor_key)
-    ).first()
-    if not sensor:
+) -> SensorIdentity:
+    ident = sensor_key_cache.get(x_sensor_key, _NOT_CACHED)
+    if ident is _NOT_CACHED:
+        async with AsyncSession(async_read_engine) as session:
+            row = (await session.exec(
+                select(Sensor.id, Sensor.series_id).where(Sensor.api_key == x_sensor_key)
+            )).first()
+        if row:
+            ident = SensorIdentity(*row)
+            sensor_key_cache.set(x_sensor_key, ident)
+        else:
+            ident = None
+            sensor_key_cache.set(x_sensor_key, None, ttl=SENSOR_CACHE_NEGATIVE_TTL)
+    if ident is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or unknown sensor key",
         )
-    return sensor
+    # limit liczony po id sensora - nieznane klucze nie zajmują miejsca w limiterze
+    await sensor_limiter.check_async(ident.id)
+    return ident
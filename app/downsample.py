@@ -0,0 +1,110 @@
+# app/downsample.py
+import os
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlmodel import Session
+
+from .models import Measurement
+from . import coldstore
+
+DOWNSAMPLE_CHUNK = int(os.getenv("DOWNSAMPLE_CHUNK", "5000"))
+
+Point = Tuple[int, datetime, float]
+
+
+def _epoch(ts: datetime) -> float:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def minmax_decimate(
+    points: Iterable[Point],
+    start: float,
+    end: float,
+    max_points: int,
+) -> List[Point]:
+    """Decymacja min/max: dla każdego z max_points // 2 przedziałów czasu
+    zostają punkty z wartością minimalną i maksymalną.
+
+    Punkty muszą być posortowane po czasie; pamięć zależy tylko od max_points.
+    """
+    buckets = max(1, max_points // 2)
+    span = (end - start) or 1.0
+    out: List[Point] = []
+    current = -1
+    lo: Optional[Point] = None
+    hi: Optional[Point] = None
+
+    def emit():
+        if lo is None:
+            return
+        if lo is hi:
+            out.append(lo)
+        else:
+            out.extend(sorted((lo, hi), key=lambda p: (p[1], p[0])))
+
+    for point in points:
+        idx = min(buckets - 1, max(0, int((_epoch(point[1]) - start) / span * buckets)))
+        if idx != current:
+            emit()
+            current, lo, hi = idx, point, point
+            continue
+        if point[2] < lo[2]:
+            lo = point
+        if point[2] > hi[2]:
+            hi = point
+    emit()
+    return out
+
+
+def downsample_series(
+    session: Session,
+    series_id: int,
+    max_points: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> List[Tuple[int, int, float, datetime]]:
+    """Co najwyżej max_points pomiarów serii, strumieniowo, bez obiektów ORM;
+    krotki (id, series_id, value, timestamp)."""
+    filters = [Measurement.series_id == series_id]
+    if start is not None:
+        filters.append(Measurement.timestamp >= start)
+    if end is not None:
+        filters.append(Measurement.timestamp <= end)
+
+    total, first_ts, last_ts = session.execute(
+        select(func.count(), func.min(Measurement.timestamp), func.max(Measurement.timestamp)).where(*filters)
+    ).one()
+    cold = coldstore.has_blocks(session, [series_id], start, end)
+    if cold:
+        cold_total, cold_first, cold_last = coldstore.range_stats(session, series_id, start, end)
+        if cold_total:
+            total += cold_total
+            first_ts = cold_first if first_ts is None else min(first_ts, cold_first)
+            last_ts = cold_last if last_ts is None else max(last_ts, cold_last)
+    if not total:
+        return []
+
+    stmt = (
+        select(Measurement.id, Measurement.timestamp, Measurement.value)
+        .where(*filters)
+        .order_by(Measurement.timestamp.asc(), Measurement.id.asc())
+        .execution_options(yield_per=DOWNSAMPLE_CHUNK)
+    )
+    rows = session.execute(stmt)
+    stream: Iterable[Point] = rows
+    if cold:
+        stream = coldstore.merge(
+            ((ts, mid, value) for mid, ts, value in rows),
+            coldstore.iter_readings(session, [series_id], start, end),
+        )
+        stream = ((p[1], p[0], p[-1]) for p in stream)
+    if total <= max_points:
+        points = list(stream)
+    else:
+        points = minmax_decimate(stream, _epoch(first_ts), _epoch(last_ts), max_points)
+    rows.close()
+    return [(p[0], series_id, p[2], p[1]) for p in points]
@@ -0,0 +1,20 @@
+# app/events.py
+from typing import Any, Dict, Iterable
+
+from sqlmodel import Session
+
+from . import latest
+from .broker import broker
+
+
+def measurements_committed(readings: Iterable[Dict[str, Any]]) -> None:
+    """Wywoływane po commicie nowych pomiarów: ostatnie wartości i strumienie."""
+    readings = list(readings)
+    latest.observe(readings)
+    broker.publish(readings)
+
+
+def measurements_changed(session: Session, series_ids: Iterable[int]) -> None:
+    """Wywoływane po commicie zmiany lub usunięcia pomiarów."""
+    for series_id in set(series_ids):
+        latest.refresh_series(session, series_id)
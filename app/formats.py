@@ -0,0 +1,145 @@
+# app/formats.py
+# Binarne formaty odczytów dla czujników i klientów:
+# - MessagePack: odczyt to mapa {"value", "timestamp"} albo para [timestamp, value];
+#   timestamp jako epoch-millis (int), rozszerzenie Timestamp msgpack, ISO 8601 lub nil,
+# - packed: stały układ little-endian, 16 bajtów na odczyt (int64 epoch-millis, float64).
+import math
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import msgpack
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+PACKED = "application/x-packed-readings"
+_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK}
+
+PACKED_READING = struct.Struct("<qd")
+# w formacie packed ta wartość znacznika czasu oznacza "czas serwera"
+PACKED_NO_TIMESTAMP = -(2 ** 63)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+Reading = Tuple[Optional[datetime], float]
+
+
+def media_type(header: Optional[str]) -> str:
+    """Typ z nagłówka Content-Type (bez parametrów); brak nagłówka = JSON."""
+    if not header:
+        return JSON
+    mt = header.split(";", 1)[0].strip().lower()
+    return _ALIASES.get(mt, mt)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Format odpowiedzi z nagłówka Accept: pierwszy obsługiwany typ, domyślnie JSON."""
+    for part in (accept or "").split(","):
+        mt = media_type(part)
+        if mt in (JSON, MSGPACK, PACKED):
+            return mt
+    return JSON
+
+
+def epoch_millis(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - _EPOCH) // timedelta(milliseconds=1)
+
+
+def from_millis(ms: int) -> datetime:
+    return _EPOCH + timedelta(milliseconds=ms)
+
+
+def _timestamp(raw: Any) -> Optional[datetime]:
+    if raw is None:
+        return None
+    if isinstance(raw, datetime):
+        return raw
+    if isinstance(raw, int) and not isinstance(raw, bool):
+        return from_millis(raw)
+    if isinstance(raw, str):
+        return datetime.fromisoformat(raw)
+    raise ValueError("timestamp must be epoch millis, a msgpack timestamp or an ISO 8601 string")
+
+
+def _value(raw: Any) -> float:
+    if isinstance(raw, bool) or not isinstance(raw, (int, float)):
+        raise ValueError("value must be a number")
+    value = float(raw)
+    if not math.isfinite(value):
+        raise ValueError("value must be finite")
+    return value
+
+
+def _reading(obj: Any) -> Reading:
+    if isinstance(obj, dict):
+        if "value" not in obj:
+            raise ValueError("missing value")
+        return _timestamp(obj.get("timestamp")), _value(obj["value"])
+    if isinstance(obj, (list, tuple)) and len(obj) == 2:
+        return _timestamp(obj[0]), _value(obj[1])
+    raise ValueError("reading must be a map or a [timestamp, value] pair")
+
+
+def _readings(items: Sequence[Any]) -> List[Reading]:
+    readings = []
+    for index, obj in enumerate(items):
+        try:
+            readings.append(_reading(obj))
+        except (ValueError, OverflowError) as e:
+            raise ValueError(f"reading {index}: {e}")
+    return readings
+
+
+def decode_msgpack(body: bytes, many: bool) -> List[Reading]:
+    try:
+        obj = msgpack.unpackb(body, raw=False, timestamp=3)
+    except Exception as e:
+        raise ValueError(f"invalid MessagePack body: {e}")
+    if not many:
+        return _readings([obj])
+    if not isinstance(obj, list):
+        raise ValueError("batch body must be an array of readings")
+    return _readings(obj)
+
+
+def decode_packed(body: bytes, many: bool) -> List[Reading]:
+    if len(body) % PACKED_READING.size:
+        raise ValueError(f"packed body length must be a multiple of {PACKED_READING.size} bytes")
+    if not many and len(body) != PACKED_READING.size:
+        raise ValueError("expected exactly one packed reading")
+    readings = []
+    for index, (ms, value) in enumerate(PACKED_READING.iter_unpack(body)):
+        if not math.isfinite(value):
+            raise ValueError(f"reading {index}: value must be finite")
+        try:
+            readings.append((None if ms == PACKED_NO_TIMESTAMP else from_millis(ms), value))
+        except OverflowError:
+            raise ValueError(f"reading {index}: timestamp out of range")
+    return readings
+
+
+def decode(body: bytes, content_type: str, many: bool) -> List[Reading]:
+    """Odczyty z ciała żądania w formacie msgpack/packed; ValueError przy błędzie."""
+    if content_type == MSGPACK:
+        return decode_msgpack(body, many)
+    if content_type == PACKED:
+        return decode_packed(body, many)
+    raise ValueError(f"unsupported content type {content_type}")
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(obj)
+    raise TypeError(f"cannot serialize {type(obj).__name__}")
+
+
+def encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=_msgpack_default)
+
+
+def encode_packed(readings: Iterable[Tuple[datetime, float]]) -> bytes:
+    return b"".join(PACKED_READING.pack(epoch_millis(ts), value) for ts, value in readings)
@@ -0,0 +1,194 @@
+# app/gorilla.py
+# Kodowanie bloków pomiarów w stylu Gorilla (Facebook, VLDB 2015):
+# znaczniki czasu jako delta-of-delta, wartości jako XOR z poprzednią.
+# Identyfikatory pomiarów zapisywane są osobno jako różnice (varint).
+import struct
+from typing import List, Sequence, Tuple
+
+VERSION = 1
+
+
+class _BitWriter:
+    def __init__(self):
+        self.buf = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value: int, nbits: int) -> None:
+        self._acc = (self._acc << nbits) | value
+        self._bits += nbits
+        while self._bits >= 8:
+            self._bits -= 8
+            self.buf.append((self._acc >> self._bits) & 0xFF)
+        self._acc &= (1 << self._bits) - 1
+
+    def getvalue(self) -> bytes:
+        if self._bits:
+            return bytes(self.buf) + bytes([(self._acc << (8 - self._bits)) & 0xFF])
+        return bytes(self.buf)
+
+
+class _BitReader:
+    def __init__(self, data: bytes, pos: int):
+        self._data = data
+        self._pos = pos
+        self._acc = 0
+        self._bits = 0
+
+    def read(self, nbits: int) -> int:
+        while self._bits < nbits:
+            self._acc = (self._acc << 8) | self._data[self._pos]
+            self._pos += 1
+            self._bits += 8
+        self._bits -= nbits
+        value = self._acc >> self._bits
+        self._acc &= (1 << self._bits) - 1
+        return value
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) if n >= 0 else ((-n) << 1) - 1
+
+
+def _unzigzag(n: int) -> int:
+    return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+
+
+def _put_varint(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+# (prefiks, długość prefiksu, bity wartości) dla delta-of-delta
+_DOD_CLASSES = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12), (0b11110, 5, 32))
+
+
+def _float_bits(value: float) -> int:
+    return struct.unpack(">Q", struct.pack(">d", value))[0]
+
+
+def _bits_float(bits: int) -> float:
+    return struct.unpack(">d", struct.pack(">Q", bits))[0]
+
+
+def encode(ids: Sequence[int], timestamps: Sequence[int], values: Sequence[float]) -> bytes:
+    """Koduje blok; timestamps w mikrosekundach od epoki, posortowane rosnąco."""
+    n = len(ids)
+    out = bytearray([VERSION])
+    _put_varint(out, n)
+    prev = 0
+    for i in ids:
+        _put_varint(out, _zigzag(i - prev))
+        prev = i
+    if not n:
+        return bytes(out)
+
+    w = _BitWriter()
+    w.write(_zigzag(timestamps[0]), 64)
+    prev_ts, prev_delta = timestamps[0], 0
+    for ts in timestamps[1:]:
+        delta = ts - prev_ts
+        dod = delta - prev_delta
+        prev_ts, prev_delta = ts, delta
+        if dod == 0:
+            w.write(0, 1)
+            continue
+        for prefix, plen, nbits in _DOD_CLASSES:
+            half = 1 << (nbits - 1)
+            if -half < dod <= half:
+                w.write(prefix, plen)
+                w.write(dod + half - 1, nbits)
+                break
+        else:
+            w.write(0b11111, 5)
+            w.write(_zigzag(dod), 64)
+
+    prev_bits = _float_bits(values[0])
+    w.write(prev_bits, 64)
+    lead, trail = -1, 0
+    for value in values[1:]:
+        bits = _float_bits(value)
+        x = bits ^ prev_bits
+        prev_bits = bits
+        if x == 0:
+            w.write(0, 1)
+            continue
+        lz = min(64 - x.bit_length(), 31)
+        tz = (x & -x).bit_length() - 1
+        if lead >= 0 and lz >= lead and tz >= trail:
+            # znaczące bity mieszczą się w oknie poprzedniej wartości
+            w.write(0b10, 2)
+            w.write(x >> trail, 64 - lead - trail)
+        else:
+            sig = 64 - lz - tz
+            w.write(0b11, 2)
+            w.write(lz, 5)
+            w.write(sig - 1, 6)
+            w.write(x >> tz, sig)
+            lead, trail = lz, tz
+    out += w.getvalue()
+    return bytes(out)
+
+
+def decode(data: bytes) -> Tuple[List[int], List[int], List[float]]:
+    """Odwrotność encode: (ids, timestamps_us, values)."""
+    if data[0] != VERSION:
+        raise ValueError(f"Unsupported block version {data[0]}")
+    n, pos = _get_varint(data, 1)
+    ids: List[int] = []
+    prev = 0
+    for _ in range(n):
+        z, pos = _get_varint(data, pos)
+        prev += _unzigzag(z)
+        ids.append(prev)
+    if not n:
+        return [], [], []
+
+    r = _BitReader(data, pos)
+    ts = _unzigzag(r.read(64))
+    timestamps = [ts]
+    delta = 0
+    for _ in range(n - 1):
+        if r.read(1) == 0:
+            dod = 0
+        else:
+            # liczba jedynek w prefiksie wskazuje klasę (10, 110, 1110, 11110, 11111)
+            ones = 1
+            while ones < 5 and r.read(1) == 1:
+                ones += 1
+            if ones == 5:
+                dod = _unzigzag(r.read(64))
+            else:
+                half = 1 << (_DOD_CLASSES[ones - 1][2] - 1)
+                dod = r.read(_DOD_CLASSES[ones - 1][2]) - half + 1
+        delta += dod
+        ts += delta
+        timestamps.append(ts)
+
+    bits = r.read(64)
+    values = [_bits_float(bits)]
+    lead = trail = 0
+    for _ in range(n - 1):
+        if r.read(1) == 0:
+            values.append(values[-1])
+            continue
+        if r.read(1) == 1:
+            lead = r.read(5)
+            sig = r.read(6) + 1
+            trail = 64 - lead - sig
+        bits ^= r.read(64 - lead - trail) << trail
+        values.append(_bits_float(bits))
+    return ids, timestamps, values
@@ -0,0 +1,199 @@
+# app/ingest.py
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+from sqlmodel import Session
+
+from .db import engine
+from .models import Measurement
+from . import rollups, versions
+from . import events
+
+INGEST_QUEUE_ENABLED = os.getenv("INGEST_QUEUE_ENABLED", "0").lower() in ("1", "true", "yes")
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "500"))
+INGEST_FLUSH_MS = float(os.getenv("INGEST_FLUSH_MS", "50"))
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "10000"))
+# "wait" - odpowiedź 201 dopiero po zapisie paczki; "ack" - 202 od razu po zakolejkowaniu
+INGEST_DURABILITY = os.getenv("INGEST_DURABILITY", "wait").lower()
+INGEST_WAIT_TIMEOUT = float(os.getenv("INGEST_WAIT_TIMEOUT", "5"))
+# ponowienia całej paczki po błędzie operacyjnym (blokada, timeout), z podwajaną przerwą
+INGEST_RETRIES = int(os.getenv("INGEST_RETRIES", "3"))
+INGEST_RETRY_MS = float(os.getenv("INGEST_RETRY_MS", "100"))
+
+Pending = Tuple[Dict[str, Any], Future]
+
+log = logging.getLogger("app.ingest")
+
+
+def _row_error(exc: Exception) -> bool:
+    """Błąd wynikający z samych wierszy (klucz obcy, ograniczenie, zła wartość)
+    - wtedy warto dzielić paczkę. Pozostałe (blokada bazy, timeout, zerwane
+    połączenie) dotyczą całej paczki."""
+    if isinstance(exc, (IntegrityError, DataError)):
+        return True
+    # błąd przetwarzania parametrów, zanim instrukcja trafiła do bazy
+    return isinstance(exc, StatementError) and not isinstance(exc, DBAPIError)
+
+
+class IngestQueue:
+    """Kolejka write-behind: odczyty z wielu żądań zapisywane są grupowo,
+    jednym INSERT-em i jednym commitem na paczkę."""
+
+    def __init__(self, flush_rows: int, flush_ms: float, max_size: int):
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self._queue: "queue.Queue[Pending]" = queue.Queue(maxsize=max_size)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rows_flushed = 0
+        self.rows_failed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Zatrzymuje writer po opróżnieniu kolejki."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, row: Dict[str, Any]) -> Future:
+        """Kolejkuje zwalidowany odczyt; rzuca queue.Full gdy kolejka jest pełna."""
+        if not self.running:
+            raise RuntimeError("Ingest queue is not running")
+        future: Future = Future()
+        self._queue.put_nowait((row, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            batch: List[Pending] = [first]
+            deadline = time.monotonic() + self.flush_ms / 1000
+            while len(batch) < self.flush_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: List[Pending]) -> None:
+        failed = self._store(batch)
+        if failed and INGEST_DURABILITY == "ack":
+            # te odczyty dostały już 202 - klient nie dowie się o błędzie
+            log.error("ingest flush lost %d of %d acknowledged readings", failed, len(batch))
+
+    def _store(self, batch: List[Pending], split: bool = False) -> int:
+        """Zapis paczki w jednej transakcji. Przy błędzie wierszy paczka jest
+        dzielona na połowy, aż zawiodą tylko złe wiersze; przy błędzie
+        operacyjnym cała paczka jest ponawiana (INGEST_RETRIES), a potem
+        odrzucana w całości. Zwraca liczbę odrzuconych wierszy."""
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                ids = self._insert(batch)
+            except Exception as exc:
+                with self._lock:
+                    self.failed_flushes += 1
+                if _row_error(exc):
+                    if not split:
+                        log.exception("ingest flush of %d rows failed, isolating bad rows", len(batch))
+                    if len(batch) > 1:
+                        half = len(batch) // 2
+                        return self._store(batch[:half], True) + self._store(batch[half:], True)
+                    log.error("ingest row rejected: %s", exc)
+                    return self._fail(batch, exc)
+                if attempt >= INGEST_RETRIES:
+                    log.exception("ingest flush of %d rows failed after %d attempts", len(batch), attempt + 1)
+                    return self._fail(batch, exc)
+                delay = INGEST_RETRY_MS / 1000 * 2 ** attempt
+                log.warning("ingest flush of %d rows failed (%s), retrying in %.0f ms", len(batch), exc, delay * 1000)
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.flushes += 1
+                self.rows_flushed += len(batch)
+                self.last_flush_ms = elapsed
+                self.max_flush_ms = max(self.max_flush_ms, elapsed)
+                self.total_flush_ms += elapsed
+            events.measurements_committed({"id": i, **row} for (row, _), i in zip(batch, ids))
+            for (_, future), measurement_id in zip(batch, ids):
+                future.set_result(measurement_id)
+            return 0
+
+    def _insert(self, batch: List[Pending]) -> List[int]:
+        with Session(engine) as session:
+            ids = session.scalars(
+                insert(Measurement).returning(Measurement.id, sort_by_parameter_order=True),
+                [row for row, _ in batch],
+            ).all()
+            rollups.apply_inserts(
+                session, [(row["series_id"], row["timestamp"], row["value"]) for row, _ in batch]
+            )
+            versions.bump(session, (row["series_id"] for row, _ in batch))
+            session.commit()
+        return ids
+
+    def _fail(self, batch: List[Pending], exc: Exception) -> int:
+        with self._lock:
+            self.rows_failed += len(batch)
+        for _, future in batch:
+            future.set_exception(exc)
+        return len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": INGEST_QUEUE_ENABLED,
+                "running": self.running,
+                "durability": INGEST_DURABILITY,
+                "queue_depth": self._queue.qsize(),
+                "queue_max": self._queue.maxsize,
+                "flush_rows": self.flush_rows,
+                "flush_ms": self.flush_ms,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "rows_flushed": self.rows_flushed,
+                "rows_failed": self.rows_failed,
+                "avg_batch_rows": self.rows_flushed / self.flushes if self.flushes else 0.0,
+                "last_flush_ms": self.last_flush_ms,
+                "max_flush_ms": self.max_flush_ms,
+                "avg_flush_ms": self.total_flush_ms / self.flushes if self.flushes else 0.0,
+            }
+
+
+ingest_queue = IngestQueue(INGEST_FLUSH_ROWS, INGEST_FLUSH_MS, INGEST_QUEUE_MAX)
@@ -0,0 +1,108 @@
+# app/latest.py
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select
+from sqlmodel import Session
+
+from .db import read_engine
+from .models import Measurement, MeasurementBlock
+from .rollups import to_epoch
+from . import coldstore
+
+# >0: co tyle sekund mapa jest przeładowywana z bazy (kilku workerów
+# widzi wtedy także zapisy z innych procesów)
+LATEST_REFRESH_SECONDS = float(os.getenv("LATEST_REFRESH_SECONDS", "0"))
+
+# series_id -> ostatni odczyt {"id", "series_id", "value", "timestamp"}
+_latest: Dict[int, Dict[str, Any]] = {}
+_lock = threading.Lock()
+_warmed_at: Optional[float] = None
+
+
+def _key(reading: Dict[str, Any]) -> tuple:
+    return (to_epoch(reading["timestamp"]), reading["id"])
+
+
+def warm(session: Session) -> None:
+    """Ładuje ostatni odczyt każdej serii jednym zapytaniem grupującym."""
+    global _warmed_at
+    newest = (
+        select(Measurement.series_id, func.max(Measurement.timestamp).label("ts"))
+        .group_by(Measurement.series_id)
+        .subquery()
+    )
+    rows = session.execute(
+        select(Measurement.id, Measurement.series_id, Measurement.value, Measurement.timestamp).join(
+            newest,
+            (Measurement.series_id == newest.c.series_id) & (Measurement.timestamp == newest.c.ts),
+        )
+    ).all()
+    # serie, których najnowsze odczyty są już tylko w zimnych blokach
+    for series_id in session.scalars(select(MeasurementBlock.series_id).distinct()).all():
+        cold = coldstore.latest(session, series_id)
+        rows.append((cold[1], series_id, cold[3], cold[0]))
+    fresh: Dict[int, Dict[str, Any]] = {}
+    for mid, series_id, value, ts in rows:
+        reading = {"id": mid, "series_id": series_id, "value": value, "timestamp": ts}
+        current = fresh.get(series_id)
+        if current is None or _key(reading) > _key(current):
+            fresh[series_id] = reading
+    with _lock:
+        _latest.clear()
+        _latest.update(fresh)
+        _warmed_at = time.monotonic()
+
+
+def observe(readings: Iterable[Dict[str, Any]]) -> None:
+    """Uwzględnia nowo zapisane odczyty (po commicie)."""
+    with _lock:
+        for reading in readings:
+            current = _latest.get(reading["series_id"])
+            if current is None or _key(reading) >= _key(current):
+                _latest[reading["series_id"]] = reading
+
+
+def refresh_series(session: Session, series_id: int) -> None:
+    """Po zmianie lub usunięciu pomiaru - ostatni odczyt serii wprost z bazy."""
+    row = session.execute(
+        select(Measurement.id, Measurement.value, Measurement.timestamp)
+        .where(Measurement.series_id == series_id)
+        .order_by(Measurement.timestamp.desc(), Measurement.id.desc())
+        .limit(1)
+    ).first()
+    cold = coldstore.latest(session, series_id)
+    if cold is not None and (row is None or (cold[0], cold[1]) > (row[2], row[0])):
+        row = (cold[1], cold[3], cold[0])
+    with _lock:
+        if row is None:
+            _latest.pop(series_id, None)
+        else:
+            _latest[series_id] = {"id": row[0], "series_id": series_id, "value": row[1], "timestamp": row[2]}
+
+
+def forget(series_id: int) -> None:
+    with _lock:
+        _latest.pop(series_id, None)
+
+
+def refresh_due() -> bool:
+    return LATEST_REFRESH_SECONDS > 0 and (
+        _warmed_at is None or time.monotonic() - _warmed_at > LATEST_REFRESH_SECONDS
+    )
+
+
+def reload() -> None:
+    with Session(read_engine) as session:
+        warm(session)
+
+
+def get_latest(series_id: int) -> Optional[Dict[str, Any]]:
+    return _latest.get(series_id)
+
+
+def all_latest() -> List[Dict[str, Any]]:
+    with _lock:
+        return [_latest[sid] for sid in sorted(_latest)]
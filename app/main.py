@@ -2,13 +2,21 @@ import os
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlmodel import Session
 
-from .db import init_db
+from .db import engine, init_db
+from .ingest import ingest_queue, INGEST_QUEUE_ENABLED
+from .retention import retention_worker, RETENTION_ENABLED, COLD_AFTER_DAYS
 from .routers import auth as auth_router
 from .routers import series as series_router
 from .routers import measurements as measurements_router
 from .routers.sensors import router as sensors_router
 from .errors import setup_error_handlers
+from .auth import password_pool
+from . import series_cache
+from . import latest
+from . import metrics
+from . import slowlog
 
 ALLOWED_ORIGINS = [o.strip() for o in os.getenv("ALLOWED_ORIGINS", "*").split(",")]
 
@@ -21,16 +29,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["X-Total-Count"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "ETag", "Last-Modified"],
 )
 
 
 @app.on_event("startup")
 def on_startup():
     init_db()
+    with Session(engine) as session:
+        series_cache.load_all(session)
+        latest.warm(session)
+    if INGEST_QUEUE_ENABLED:
+        ingest_queue.start()
+    if RETENTION_ENABLED or COLD_AFTER_DAYS > 0:
+        retention_worker.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    retention_worker.stop()
+    ingest_queue.stop()
+    password_pool.shutdown()
 
 
 app.include_router(auth_router.router)
 app.include_router(series_router.router)
 app.include_router(measurements_router.router)
 app.include_router(sensors_router)
+
+if metrics.METRICS_ENABLED:
+    metrics.install(app)
+if slowlog.SLOW_QUERY_MS > 0:
+    slowlog.install(app)
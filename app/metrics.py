@@ -0,0 +1,265 @@
+# app/metrics.py
+# Metryki HTTP i bazy w formacie Prometheus (GET /metrics):
+# - liczba żądań, histogram czasów i żądania w toku per trasa,
+# - liczba i czas zapytań SQL per trasa (zdarzenia kursora SQLAlchemy),
+# - wykrywanie N+1: to samo zapytanie wykonane w jednym żądaniu co najmniej
+#   METRICS_N_PLUS_ONE_THRESHOLD razy.
+# Przy METRICS_ENABLED=0 nic nie jest rejestrowane - ani middleware, ani
+# zdarzenia silników, ani sam endpoint.
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Header, HTTPException, Response
+from sqlalchemy import event
+from starlette.routing import Match
+
+from .db import all_engines
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0").lower() in ("1", "true", "yes")
+# opcjonalny token dla scrapera (Authorization: Bearer ...)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.getenv("METRICS_N_PLUS_ONE_THRESHOLD", "10"))
+
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+QUERY_COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100]
+# żądania bez dopasowanej trasy mają wspólną etykietę - ścieżki z 404 nie mnożą serii
+UNMATCHED = "<unmatched>"
+BACKGROUND = "<background>"
+
+log = logging.getLogger("app.metrics")
+
+# listy wartości parametrów (IN (?, ?, ...)) nie tworzą nowych kształtów zapytania
+_PARAM_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|%s|\$\d+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|\$\d+)\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    return _PARAM_LIST.sub("(?...)", statement)
+
+
+class RequestQueries:
+    """Zapytania bieżącego żądania (w ContextVar, widoczne też w wątkach puli)."""
+
+    __slots__ = ("count", "seconds", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Dict[str, int] = {}
+
+
+current_queries: ContextVar[Optional[RequestQueries]] = ContextVar("current_queries", default=None)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.durations: Dict[Tuple[str, str], Histogram] = {}
+        self.in_flight: Dict[Tuple[str, str], int] = {}
+        self.queries: Dict[str, int] = {}
+        self.query_seconds: Dict[str, float] = {}
+        self.queries_per_request: Dict[str, Histogram] = {}
+        self.n_plus_one: Dict[str, int] = {}
+
+    def request_started(self, method: str, route: str) -> None:
+        with self._lock:
+            self.in_flight[(method, route)] = self.in_flight.get((method, route), 0) + 1
+
+    def request_finished(
+        self, method: str, route: str, status: int, seconds: float, queries: RequestQueries, n_plus_one: bool
+    ) -> None:
+        with self._lock:
+            self.in_flight[(method, route)] -= 1
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            hist = self.durations.get((method, route))
+            if hist is None:
+                hist = self.durations[(method, route)] = Histogram(DURATION_BUCKETS)
+            hist.observe(seconds)
+            self.queries[route] = self.queries.get(route, 0) + queries.count
+            self.query_seconds[route] = self.query_seconds.get(route, 0.0) + queries.seconds
+            hist = self.queries_per_request.get(route)
+            if hist is None:
+                hist = self.queries_per_request[route] = Histogram(QUERY_COUNT_BUCKETS)
+            hist.observe(queries.count)
+            if n_plus_one:
+                self.n_plus_one[route] = self.n_plus_one.get(route, 0) + 1
+
+    def background_query(self, seconds: float) -> None:
+        # zapytania spoza żądań: kolejka zapisu, retencja, start aplikacji
+        with self._lock:
+            self.queries[BACKGROUND] = self.queries.get(BACKGROUND, 0) + 1
+            self.query_seconds[BACKGROUND] = self.query_seconds.get(BACKGROUND, 0.0) + seconds
+
+    def render(self) -> str:
+        out: List[str] = []
+        with self._lock:
+            out += _family("http_requests_total", "counter", "HTTP requests by route and status")
+            for (method, route, status), n in sorted(self.requests.items()):
+                out.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {n}")
+            out += _family("http_request_duration_seconds", "histogram", "HTTP request latency")
+            for (method, route), hist in sorted(self.durations.items()):
+                out += _histogram("http_request_duration_seconds", hist, method=method, route=route)
+            out += _family("http_requests_in_flight", "gauge", "HTTP requests currently being served")
+            for (method, route), n in sorted(self.in_flight.items()):
+                out.append(f"http_requests_in_flight{_labels(method=method, route=route)} {n}")
+            out += _family("db_queries_total", "counter", "SQL statements executed, by route")
+            for route, n in sorted(self.queries.items()):
+                out.append(f"db_queries_total{_labels(route=route)} {n}")
+            out += _family("db_query_seconds_total", "counter", "Time spent in SQL statements, by route")
+            for route, s in sorted(self.query_seconds.items()):
+                out.append(f"db_query_seconds_total{_labels(route=route)} {s:.6f}")
+            out += _family("db_queries_per_request", "histogram", "SQL statements per HTTP request")
+            for route, hist in sorted(self.queries_per_request.items()):
+                out += _histogram("db_queries_per_request", hist, route=route)
+            out += _family("db_n_plus_one_total", "counter", "Requests repeating one statement shape N+ times")
+            for route, n in sorted(self.n_plus_one.items()):
+                out.append(f"db_n_plus_one_total{_labels(route=route)} {n}")
+        return "\n".join(out) + "\n"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: Any) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _family(name: str, kind: str, help_text: str) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+def _histogram(name: str, hist: Histogram, **labels: Any) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, n in zip(hist.bounds, hist.counts):
+        cumulative += n
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {hist.total:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+    return lines
+
+
+registry = Registry()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    queries = current_queries.get()
+    if queries is None:
+        registry.background_query(seconds)
+        return
+    queries.count += 1
+    queries.seconds += seconds
+    shape = statement_shape(statement)
+    queries.shapes[shape] = queries.shapes.get(shape, 0) + 1
+
+
+def _handle_error(context):
+    # nieudane zapytanie nie dociera do after_cursor_execute
+    starts = context.connection.info.get("metrics_query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _n_plus_one(method: str, route: str, queries: RequestQueries) -> bool:
+    repeated = [(n, s) for s, n in queries.shapes.items() if n >= METRICS_N_PLUS_ONE_THRESHOLD]
+    if not repeated:
+        return False
+    n, shape = max(repeated)
+    log.warning("possible N+1 in %s %s: %d x %s", method, route, n, " ".join(shape.split())[:300])
+    return True
+
+
+def _match_route(routes, scope) -> str:
+    """Szablon trasy, którą wybierze router (jak scope["route"] po routingu);
+    potrzebny już przed wywołaniem aplikacji - dla miernika żądań w toku."""
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED)
+        if match == Match.PARTIAL and partial is None:
+            partial = route
+    return getattr(partial, "path", UNMATCHED)
+
+
+class MetricsMiddleware:
+    """Czyste ASGI (bez BaseHTTPMiddleware) - ContextVar ustawiony tutaj
+    widzą handler, zależności i wątki puli, do których trafiają endpointy."""
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        status = 500
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        route = _match_route(self.router.routes, scope)
+        registry.request_started(method, route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - started
+            current_queries.reset(token)
+            registry.request_finished(
+                method, route, status, seconds, queries, _n_plus_one(method, route, queries)
+            )
+
+
+def install(app: FastAPI) -> None:
+    """Middleware, zdarzenia silników i GET /metrics; wywoływać przed startem aplikacji."""
+    for eng in all_engines():
+        event.listen(eng, "before_cursor_execute", _before_cursor_execute)
+        event.listen(eng, "after_cursor_execute", _after_cursor_execute)
+        event.listen(eng, "handle_error", _handle_error)
+    app.add_middleware(MetricsMiddleware, router=app.router)
+
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics(authorization: Optional[str] = Header(None)):
+        if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+        return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
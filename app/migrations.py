@@ -0,0 +1,121 @@
+# app/migrations.py
+# create_all() nie zmienia istniejących tabel - zmiany schematu dla starszych
+# baz trafiają tutaj. Migracje muszą być idempotentne, bo na świeżej bazie
+# create_all() tworzy od razu aktualny schemat.
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+Migration = Tuple[int, str, Callable[[Connection], None]]
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    def register(fn: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+@migration(1, "composite index measurement(series_id, timestamp, id)")
+def _composite_measurement_index(conn: Connection) -> None:
+    # id na końcu - indeks daje od razu kolejność ORDER BY timestamp, id
+    # (stronicowanie kursorem), bez sortowania każdej strony
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_measurement_series_id_timestamp "
+        "ON measurement (series_id, timestamp, id)"
+    ))
+    # prefiks indeksu złożonego obsługuje też zapytania i kaskady po series_id
+    conn.execute(text("DROP INDEX IF EXISTS ix_measurement_series_id"))
+
+
+@migration(2, "backfill rollup_1m / rollup_1h from measurement")
+def _backfill_rollups(conn: Connection) -> None:
+    from sqlmodel import Session
+
+    from .rollups import rebuild
+
+    with Session(bind=conn) as session:
+        rebuild(session)
+        session.flush()
+
+
+@migration(3, "series.retention_days")
+def _series_retention_days(conn: Connection) -> None:
+    columns = {c["name"] for c in inspect(conn).get_columns("series")}
+    if "retention_days" not in columns:
+        conn.execute(text("ALTER TABLE series ADD COLUMN retention_days INTEGER"))
+
+
+@migration(4, "measurement_block.min_id / max_id")
+def _block_id_range(conn: Connection) -> None:
+    from .gorilla import decode
+
+    columns = {c["name"] for c in inspect(conn).get_columns("measurement_block")}
+    for name in ("min_id", "max_id"):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE measurement_block ADD COLUMN {name} INTEGER"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_measurement_block_min_id ON measurement_block (min_id, max_id)"
+    ))
+    blocks = conn.execute(text("SELECT id, data FROM measurement_block WHERE min_id IS NULL")).all()
+    for block_id, data in blocks:
+        ids = decode(data)[0]
+        conn.execute(
+            text("UPDATE measurement_block SET min_id = :lo, max_id = :hi WHERE id = :id"),
+            {"lo": min(ids, default=None), "hi": max(ids, default=None), "id": block_id},
+        )
+
+
+@migration(5, "measurement ids never reused (SQLite AUTOINCREMENT)")
+def _measurement_autoincrement(conn: Connection) -> None:
+    if conn.dialect.name != "sqlite":
+        return
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'measurement'")).scalar()
+    if "AUTOINCREMENT" in ddl.upper():
+        return
+    from .models import Measurement
+
+    # SQLite nie zmieni definicji klucza w miejscu - przebudowa tabeli
+    conn.execute(text("ALTER TABLE measurement RENAME TO measurement_old"))
+    indexes = conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'measurement_old' AND sql IS NOT NULL"
+    )).scalars().all()
+    for name in indexes:
+        conn.execute(text(f"DROP INDEX {name}"))
+    Measurement.__table__.create(conn)
+    conn.execute(text(
+        "INSERT INTO measurement (id, series_id, value, timestamp) "
+        "SELECT id, series_id, value, timestamp FROM measurement_old"
+    ))
+    conn.execute(text("DROP TABLE measurement_old"))
+    # licznik ponad id wszystkich odczytów, także już zamkniętych w blokach
+    seq = conn.execute(text(
+        "SELECT MAX(COALESCE((SELECT MAX(id) FROM measurement), 0), "
+        "COALESCE((SELECT MAX(max_id) FROM measurement_block), 0))"
+    )).scalar()
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'measurement'"))
+    conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('measurement', :seq)"), {"seq": seq})
+
+def run_migrations(engine: Engine) -> List[int]:
+    """Wykonuje niezaaplikowane migracje; zwraca listę nowych wersji."""
+    applied: List[int] = []
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL)"
+        ))
+        done = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description) VALUES (:v, :d)"),
+                {"v": version, "d": description},
+            )
+        applied.append(version)
+    return applied
@@ -1,7 +1,7 @@
 from typing import Optional, List
 from datetime import datetime, timezone
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy import Column, Integer, ForeignKey, Index, LargeBinary, PrimaryKeyConstraint
 
 
 class User(SQLModel, table=True):
@@ -18,6 +18,8 @@ class Series(SQLModel, table=True):
     max_value: float
     color: Optional[str] = None
     icon: Optional[str] = None
+    # starsze pomiary usuwa w tle app/retention.py; None = bez limitu
+    retention_days: Optional[int] = None
 
     measurements: List["Measurement"] = Relationship(
         back_populates="series",
@@ -36,13 +38,18 @@ class Series(SQLModel, table=True):
 
 
 class Measurement(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_measurement_series_id_timestamp", "series_id", "timestamp", "id"),
+        # id nie może wrócić po zamknięciu najnowszych wierszy w bloku (coldstore)
+        {"sqlite_autoincrement": True},
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     series_id: int = Field(
         sa_column=Column(
             Integer,
             ForeignKey("series.id", ondelete="CASCADE"),
             nullable=False,
-            index=True,
         )
     )
     value: float
@@ -68,3 +75,93 @@ class Sensor(SQLModel, table=True):
     )
 
     series: Optional[Series] = Relationship(back_populates="sensors")
+
+
+class RollupBase(SQLModel):
+    bucket: int = Field(primary_key=True)
+    count: int
+    total: float
+    min_value: float
+    max_value: float
+    first_value: float
+    first_ts: float
+    last_value: float
+    last_ts: float
+
+
+class RollupMinute(RollupBase, table=True):
+    __tablename__ = "rollup_1m"
+    __table_args__ = (PrimaryKeyConstraint("series_id", "bucket"),)
+
+    series_id: int = Field(
+        sa_column=Column(
+            Integer,
+            ForeignKey("series.id", ondelete="CASCADE"),
+            primary_key=True,
+        )
+    )
+
+
+class RollupHour(RollupBase, table=True):
+    __tablename__ = "rollup_1h"
+    __table_args__ = (PrimaryKeyConstraint("series_id", "bucket"),)
+
+    series_id: int = Field(
+        sa_column=Column(
+            Integer,
+            ForeignKey("series.id", ondelete="CASCADE"),
+            primary_key=True,
+        )
+    )
+
+
+class SeriesVersion(SQLModel, table=True):
+    """Licznik zapisów serii (app/versions.py); series_id = 0 to lista serii."""
+
+    __tablename__ = "series_version"
+
+    series_id: int = Field(primary_key=True)
+    version: int = 0
+    updated_at: Optional[datetime] = None
+
+
+class MeasurementBlock(SQLModel, table=True):
+    """Zamknięty blok starych pomiarów serii, zakodowany przez app/gorilla.py."""
+
+    __tablename__ = "measurement_block"
+    __table_args__ = (
+        Index("ix_measurement_block_series_id_start_ts", "series_id", "start_ts", "end_ts"),
+        Index("ix_measurement_block_min_id", "min_id", "max_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    series_id: int = Field(
+        sa_column=Column(
+            Integer,
+            ForeignKey("series.id", ondelete="CASCADE"),
+            nullable=False,
+        )
+    )
+    start_ts: datetime
+    end_ts: datetime
+    count: int
+    total: float
+    min_value: float
+    max_value: float
+    first_value: float
+    last_value: float
+    # zakres id odczytów w bloku - szukanie odczytu po id (PUT/PATCH/DELETE)
+    min_id: Optional[int] = None
+    max_id: Optional[int] = None
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+class RateLimitCounter(SQLModel, table=True):
+    """Licznik okna przesuwnego współdzielony przez workery (app/ratelimit.py)."""
+
+    __tablename__ = "rate_limit"
+
+    key: str = Field(primary_key=True)
+    slot: int  # numer okna: floor(czas / długość okna)
+    prev: int = 0
+    curr: int = 0
@@ -0,0 +1,239 @@
+# app/ratelimit.py
+# Limity żądań algorytmem okna przesuwnego (sliding window counter): na klucz
+# trzymamy tylko liczniki bieżącego i poprzedniego okna, a liczbę żądań
+# z ostatnich `window` sekund szacujemy jako prev * (1 - f) + curr, gdzie f to
+# ułamek upłyniętego bieżącego okna. Koszt O(1) i stała pamięć na klucz.
+# Odrzucone próby nie są liczone.
+#
+# Backendy:
+# - memory: w procesie, LRU z limitem kluczy (RATE_LIMIT_MAX_KEYS),
+# - database: tabela rate_limit wspólna dla wszystkich workerów uvicorna.
+#   Każde trafienie to osobna krótka transakcja zapisu, na własnym połączeniu
+#   (db.ratelimit_engine) - w profilu performance nie czeka na wspólną blokadę
+#   zapisu i nie wstrzymuje kolejki zapisu (app/ingest.py). SQLite i tak
+#   zapisuje po jednej transakcji naraz, więc przy SENSOR_RATE_LIMIT > 0
+#   i dużym ruchu sensorów każdy odczyt dokłada jeden zapis obok paczek
+#   kolejki; wtedy lepiej sprawdza się backend memory.
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import case, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from starlette.concurrency import run_in_threadpool
+
+from .db import IS_SQLITE, ratelimit_engine
+from .models import RateLimitCounter
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# co tyle trafień backend database usuwa przeterminowane wiersze limitera
+RATE_LIMIT_SWEEP_EVERY = int(os.getenv("RATE_LIMIT_SWEEP_EVERY", "1000"))
+
+LOGIN_RATE_LIMIT = int(os.getenv("LOGIN_RATE_LIMIT", "10"))
+LOGIN_RATE_WINDOW = float(os.getenv("LOGIN_RATE_WINDOW", "300"))
+# żądań zapisu na sensor w oknie; 0 = bez limitu
+SENSOR_RATE_LIMIT = int(os.getenv("SENSOR_RATE_LIMIT", "0"))
+SENSOR_RATE_WINDOW = float(os.getenv("SENSOR_RATE_WINDOW", "1"))
+
+# (numer okna, poprzednie okno, bieżące okno)
+Counters = Tuple[int, int, int]
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float
+
+
+def _roll(counters: Optional[Counters], w: int) -> Tuple[int, int]:
+    """(prev, curr) przesunięte do okna w."""
+    if counters is None:
+        return 0, 0
+    window, prev, curr = counters
+    if window == w:
+        return prev, curr
+    if window == w - 1:
+        return curr, 0
+    return 0, 0
+
+
+def _retry_after(prev: int, curr: int, f: float, limit: int, window: float) -> float:
+    """Po ilu sekundach szacunek spadnie poniżej limitu."""
+    if curr < limit:
+        # wystarczy, że waga poprzedniego okna zmaleje
+        return max((1 - (limit - curr - 1) / prev - f) * window, 0.0) if prev else 0.0
+    return (1 - f) * window + max(1 - (limit - 1) / curr, 0.0) * window
+
+
+class MemoryBackend:
+    """Liczniki w pamięci procesu; najdawniej używane klucze wypadają po
+    przekroczeniu maxsize (te i tak zwykle mają już wygasłe okna)."""
+
+    blocking = False
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Counters]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def hit(self, key: str, w: int, weight: float, limit: int) -> Tuple[bool, int, int]:
+        with self._lock:
+            prev, curr = _roll(self._data.get(key), w)
+            allowed = prev * weight + curr + 1 <= limit
+            if allowed:
+                curr += 1
+            self._data[key] = (w, prev, curr)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return allowed, prev, curr
+
+    def sweep(self, prefix: str, w: int) -> None:
+        pass
+
+    def reset(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "memory", "keys": len(self._data), "max_keys": self.maxsize, "evictions": self.evictions}
+
+
+class DatabaseBackend:
+    """Liczniki w tabeli rate_limit: jedno zapytanie UPSERT ... RETURNING na
+    trafienie, więc limit jest wspólny dla wszystkich workerów."""
+
+    blocking = True
+
+    def __init__(self, bind):
+        self.bind = bind
+
+    def hit(self, key: str, w: int, weight: float, limit: int) -> Tuple[bool, int, int]:
+        c = RateLimitCounter.__table__.c
+        prev = case((c.slot == w, c.prev), (c.slot == w - 1, c.curr), else_=0)
+        curr = case((c.slot == w, c.curr), else_=0)
+        stmt = (sqlite_insert if IS_SQLITE else pg_insert)(RateLimitCounter.__table__).values(
+            key=key, slot=w, prev=0, curr=1
+        )
+        # UPDATE z warunkiem: przy przekroczonym limicie wiersz się nie zmienia
+        # i RETURNING nic nie zwraca
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.key],
+            set_={"slot": w, "prev": prev, "curr": curr + 1},
+            where=prev * weight + curr + 1 <= limit,
+        ).returning(c.prev, c.curr)
+        with self.bind.begin() as conn:
+            row = conn.execute(stmt).first()
+            if row is not None:
+                return True, row[0], row[1]
+            row = conn.execute(select(prev, curr).where(c.key == key)).one()
+            return False, row[0], row[1]
+
+    def sweep(self, prefix: str, w: int) -> None:
+        c = RateLimitCounter.__table__.c
+        with self.bind.begin() as conn:
+            conn.execute(delete(RateLimitCounter).where(c.key.startswith(prefix, autoescape=True), c.slot < w - 1))
+
+    def reset(self, prefix: str) -> None:
+        c = RateLimitCounter.__table__.c
+        with self.bind.begin() as conn:
+            conn.execute(delete(RateLimitCounter).where(c.key.startswith(prefix, autoescape=True)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "database"}
+
+
+def make_backend(name: str = RATE_LIMIT_BACKEND):
+    if name == "memory":
+        return MemoryBackend(RATE_LIMIT_MAX_KEYS)
+    if name == "database":
+        return DatabaseBackend(ratelimit_engine)
+    raise ValueError(f"unknown RATE_LIMIT_BACKEND {name!r} (memory|database)")
+
+
+class RateLimiter:
+    """Limit `limit` żądań na klucz w oknie `window` sekund; limit 0 wyłącza."""
+
+    def __init__(self, name: str, limit: int, window: float, backend, detail: str = "Too many requests, try later"):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.backend = backend
+        self.detail = detail
+        self._prefix = f"{name}:"
+        self._hits = 0
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def hit(self, key: Any, now: Optional[float] = None) -> Decision:
+        if not self.enabled:
+            return Decision(True, 0, 0, 0.0)
+        now = time.time() if now is None else now
+        w = int(now // self.window)
+        f = now / self.window - w
+        allowed, prev, curr = self.backend.hit(self._prefix + str(key), w, 1 - f, self.limit)
+        with self._lock:
+            self._hits += 1
+            sweep = self._hits % RATE_LIMIT_SWEEP_EVERY == 0
+            if allowed:
+                self.allowed += 1
+            else:
+                self.rejected += 1
+        if sweep:
+            self.backend.sweep(self._prefix, w)
+        remaining = max(int(self.limit - prev * (1 - f) - curr), 0)
+        retry_after = 0.0 if allowed else _retry_after(prev, curr, f, self.limit, self.window)
+        return Decision(allowed, self.limit, remaining, retry_after)
+
+    def check(self, key: Any) -> Decision:
+        """hit(); po przekroczeniu limitu HTTP 429 z nagłówkiem Retry-After."""
+        decision = self.hit(key)
+        if not decision.allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=self.detail,
+                headers={"Retry-After": str(max(math.ceil(decision.retry_after), 1))},
+            )
+        return decision
+
+    async def check_async(self, key: Any) -> Decision:
+        if self.enabled and self.backend.blocking:
+            return await run_in_threadpool(self.check, key)
+        return self.check(key)
+
+    def reset(self) -> None:
+        self.backend.reset(self._prefix)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {"allowed": self.allowed, "rejected": self.rejected}
+        return {"name": self.name, "limit": self.limit, "window": self.window, **counts, **self.backend.stats()}
+
+
+backend = make_backend()
+login_limiter = RateLimiter(
+    "login", LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW, backend, detail="Too many login attempts, try later"
+)
+sensor_limiter = RateLimiter(
+    "sensor", SENSOR_RATE_LIMIT, SENSOR_RATE_WINDOW, backend, detail="Sensor rate limit exceeded, slow down"
+)
+
+
+def stats() -> List[Dict[str, Any]]:
+    return [login_limiter.stats(), sensor_limiter.stats()]
@@ -0,0 +1,179 @@
+# app/retention.py
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, func, select
+from sqlmodel import Session
+
+from .db import engine
+from .models import Measurement, Series
+from . import coldstore, events, rollups, versions
+from .coldstore import COLD_AFTER_DAYS
+
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "0").lower() in ("1", "true", "yes")
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+# małe paczki i przerwy między nimi - zapis czujników nie czeka długo na blokadę
+RETENTION_CHUNK_ROWS = int(os.getenv("RETENTION_CHUNK_ROWS", "2000"))
+RETENTION_PAUSE_MS = float(os.getenv("RETENTION_PAUSE_MS", "50"))
+
+
+class RetentionWorker:
+    """Wątek w tle usuwający pomiary starsze niż Series.retention_days
+    i zamykający pomiary starsze niż COLD_AFTER_DAYS w bloki."""
+
+    def __init__(self, interval: float, chunk_rows: int, pause_ms: float):
+        self.interval = interval
+        self.chunk_rows = chunk_rows
+        self.pause_ms = pause_ms
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.chunks = 0
+        self.rows_deleted = 0
+        self.rows_sealed = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_run_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if RETENTION_ENABLED:
+                    self.prune_all()
+                if COLD_AFTER_DAYS > 0:
+                    self.seal_all()
+            except Exception as exc:
+                with self._lock:
+                    self.last_error = repr(exc)
+            if self._stop.wait(self.interval):
+                return
+
+    def prune_all(self) -> int:
+        """Jedno przejście po seriach z ustawioną retencją; zwraca liczbę usuniętych wierszy."""
+        started = time.perf_counter()
+        with Session(engine) as session:
+            policies = session.execute(
+                select(Series.id, Series.retention_days).where(Series.retention_days.is_not(None))
+            ).all()
+        now = datetime.now(timezone.utc)
+        total = 0
+        for series_id, days in policies:
+            if self._stop.is_set():
+                break
+            total += self.prune_series(series_id, now - timedelta(days=days))
+        with self._lock:
+            self.runs += 1
+            self.last_run_at = now
+            self.last_run_ms = (time.perf_counter() - started) * 1000
+        return total
+
+    def prune_series(self, series_id: int, cutoff: datetime) -> int:
+        """Usuwa pomiary serii starsze niż cutoff, paczkami po chunk_rows
+        (każda we własnej, krótkiej transakcji razem z korektą rollupów)."""
+        total = 0
+        while not self._stop.is_set():
+            with Session(engine) as session:
+                oldest = (
+                    select(Measurement.timestamp)
+                    .where(Measurement.series_id == series_id, Measurement.timestamp < cutoff)
+                    .order_by(Measurement.timestamp)
+                    .limit(self.chunk_rows)
+                    .subquery()
+                )
+                boundary = session.scalar(select(func.max(oldest.c.timestamp)))
+                if boundary is None:
+                    break
+                deleted = session.execute(
+                    delete(Measurement)
+                    .where(Measurement.series_id == series_id, Measurement.timestamp <= boundary)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                deleted += coldstore.prune(session, series_id, boundary)
+                rollups.prune(session, series_id, boundary)
+                versions.bump(session, (series_id,))
+                session.commit()
+                if deleted:
+                    events.measurements_changed(session, (series_id,))
+            total += deleted
+            with self._lock:
+                self.chunks += 1
+                self.rows_deleted += deleted
+            if deleted < self.chunk_rows:
+                break
+            self._stop.wait(self.pause_ms / 1000)
+        if not self._stop.is_set():
+            # reszta starych odczytów może leżeć już tylko w zimnych blokach
+            edge = cutoff - timedelta(microseconds=1)
+            with Session(engine) as session:
+                deleted = coldstore.prune(session, series_id, edge)
+                if deleted:
+                    rollups.prune(session, series_id, edge)
+                    versions.bump(session, (series_id,))
+                    session.commit()
+                    events.measurements_changed(session, (series_id,))
+            total += deleted
+            with self._lock:
+                self.rows_deleted += deleted
+        return total
+
+    def seal_all(self) -> int:
+        """Przenosi pomiary starsze niż COLD_AFTER_DAYS do bloków, jedno okno
+        na transakcję; zwraca liczbę przeniesionych wierszy."""
+        cutoff = coldstore.sealing_cutoff(datetime.now(timezone.utc))
+        with Session(engine) as session:
+            series_ids = session.scalars(select(Series.id)).all()
+        total = 0
+        for series_id in series_ids:
+            while not self._stop.is_set():
+                with Session(engine) as session:
+                    sealed = coldstore.seal_window(session, series_id, cutoff)
+                    session.commit()
+                if not sealed:
+                    break
+                total += sealed
+                with self._lock:
+                    self.rows_sealed += sealed
+                self._stop.wait(self.pause_ms / 1000)
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": RETENTION_ENABLED,
+                "running": self.running,
+                "interval_seconds": self.interval,
+                "chunk_rows": self.chunk_rows,
+                "pause_ms": self.pause_ms,
+                "runs": self.runs,
+                "chunks": self.chunks,
+                "rows_deleted": self.rows_deleted,
+                "cold_after_days": COLD_AFTER_DAYS,
+                "rows_sealed": self.rows_sealed,
+                "last_run_at": self.last_run_at,
+                "last_run_ms": self.last_run_ms,
+                "last_error": self.last_error,
+            }
+
+
+retention_worker = RetentionWorker(RETENTION_INTERVAL_SECONDS, RETENTION_CHUNK_ROWS, RETENTION_PAUSE_MS)
@@ -0,0 +1,238 @@
+# app/rollups.py
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session
+
+from .db import IS_SQLITE, engine, init_db
+from .models import Measurement, RollupBase, RollupHour, RollupMinute
+from . import coldstore
+
+# (tabela, szerokość kubełka w sekundach)
+GRANULARITIES: List[Tuple[Type[RollupBase], int]] = [
+    (RollupMinute, 60),
+    (RollupHour, 60 * 60),
+]
+REBUILD_CHUNK = 5000
+
+Reading = Tuple[int, datetime, float]
+
+
+def to_epoch(ts: datetime) -> float:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class Accumulator:
+    __slots__ = ("count", "total", "min_value", "max_value", "first_value", "first_ts", "last_value", "last_ts")
+
+    def __init__(self, ts: float, value: float):
+        self.count = 1
+        self.total = value
+        self.min_value = self.max_value = value
+        self.first_value = self.last_value = value
+        self.first_ts = self.last_ts = ts
+
+    def add(self, ts: float, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min_value = min(self.min_value, value)
+        self.max_value = max(self.max_value, value)
+        if ts < self.first_ts:
+            self.first_ts, self.first_value = ts, value
+        if ts >= self.last_ts:
+            self.last_ts, self.last_value = ts, value
+
+    def merge(self, other: "Accumulator") -> None:
+        self.count += other.count
+        self.total += other.total
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        if other.first_ts < self.first_ts:
+            self.first_ts, self.first_value = other.first_ts, other.first_value
+        if other.last_ts >= self.last_ts:
+            self.last_ts, self.last_value = other.last_ts, other.last_value
+
+    def row(self, series_id: int, bucket: int) -> Dict[str, Any]:
+        return {"series_id": series_id, "bucket": bucket, **{k: getattr(self, k) for k in self.__slots__}}
+
+
+def _accumulate(readings: Iterable[Reading], width: int) -> Dict[Tuple[int, int], Accumulator]:
+    accs: Dict[Tuple[int, int], Accumulator] = {}
+    for series_id, ts, value in readings:
+        epoch = to_epoch(ts)
+        key = (series_id, int(epoch // width) * width)
+        acc = accs.get(key)
+        if acc is None:
+            accs[key] = Accumulator(epoch, value)
+        else:
+            acc.add(epoch, value)
+    return accs
+
+
+def _upsert(session: Session, model: Type[RollupBase], rows: List[Dict[str, Any]]) -> None:
+    table = model.__table__
+    stmt = (sqlite_insert if IS_SQLITE else pg_insert)(table)
+    ex = stmt.excluded
+    c = table.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[c.series_id, c.bucket],
+        set_={
+            "count": c.count + ex.count,
+            "total": c.total + ex.total,
+            "min_value": case((ex.min_value < c.min_value, ex.min_value), else_=c.min_value),
+            "max_value": case((ex.max_value > c.max_value, ex.max_value), else_=c.max_value),
+            "first_value": case((ex.first_ts < c.first_ts, ex.first_value), else_=c.first_value),
+            "first_ts": case((ex.first_ts < c.first_ts, ex.first_ts), else_=c.first_ts),
+            "last_value": case((ex.last_ts >= c.last_ts, ex.last_value), else_=c.last_value),
+            "last_ts": case((ex.last_ts >= c.last_ts, ex.last_ts), else_=c.last_ts),
+        },
+    )
+    session.execute(stmt, rows)
+
+
+def apply_inserts(session: Session, readings: Iterable[Reading]) -> None:
+    """Dolicza nowe odczyty do rollupów; wywoływać przed commitem zapisu."""
+    readings = list(readings)
+    if not readings:
+        return
+    for model, width in GRANULARITIES:
+        accs = _accumulate(readings, width)
+        _upsert(session, model, [acc.row(sid, bucket) for (sid, bucket), acc in accs.items()])
+
+
+def recompute(session: Session, series_id: int, ts: datetime) -> None:
+    """Przelicza z surowych danych kubełki zawierające ts (po zmianie lub usunięciu)."""
+    session.flush()
+    epoch = to_epoch(ts)
+    for model, width in GRANULARITIES:
+        bucket = int(epoch // width) * width
+        session.execute(
+            delete(model).where(model.series_id == series_id, model.bucket == bucket)
+        )
+        start = datetime.fromtimestamp(bucket, timezone.utc)
+        end = start + timedelta(seconds=width)
+        rows = session.execute(
+            select(Measurement.series_id, Measurement.timestamp, Measurement.value).where(
+                Measurement.series_id == series_id,
+                Measurement.timestamp >= start,
+                Measurement.timestamp < end,
+            )
+        ).all()
+        cold = coldstore.iter_readings(session, [series_id], start, end - timedelta(microseconds=1))
+        rows += [(r[2], r[0], r[3]) for r in cold]
+        accs = _accumulate(rows, width)
+        if accs:
+            _upsert(session, model, [acc.row(sid, b) for (sid, b), acc in accs.items()])
+
+
+def prune(session: Session, series_id: int, ts: datetime) -> None:
+    """Po usunięciu pomiarów serii do ts włącznie: kasuje starsze kubełki,
+    a kubełek zawierający ts przelicza z pozostałych danych."""
+    epoch = to_epoch(ts)
+    for model, width in GRANULARITIES:
+        bucket = int(epoch // width) * width
+        session.execute(delete(model).where(model.series_id == series_id, model.bucket < bucket))
+    recompute(session, series_id, ts)
+
+
+def rebuild(session: Session, series_id: Optional[int] = None) -> int:
+    """Odbudowuje rollupy (wszystkich serii albo jednej) z tabeli measurement
+    i bloków zimnej warstwy."""
+    for model, _ in GRANULARITIES:
+        stmt = delete(model)
+        if series_id is not None:
+            stmt = stmt.where(model.series_id == series_id)
+        session.execute(stmt)
+
+    stmt = select(Measurement.series_id, Measurement.timestamp, Measurement.value)
+    if series_id is not None:
+        stmt = stmt.where(Measurement.series_id == series_id)
+    stmt = stmt.order_by(Measurement.series_id, Measurement.timestamp).execution_options(yield_per=REBUILD_CHUNK)
+
+    total = 0
+    result = session.execute(stmt)
+    for chunk in result.partitions():
+        apply_inserts(session, chunk)
+        total += len(chunk)
+    for block in coldstore.blocks(session, None if series_id is None else [series_id]):
+        apply_inserts(session, [(r[2], r[0], r[3]) for r in coldstore.load(session, block.id)])
+        total += block.count
+    return total
+
+
+def aggregate_rollup(
+    session: Session,
+    series_id: int,
+    width: int,
+    funcs: List[str],
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> Dict[str, List[Any]]:
+    """Agregaty w kubełkach o szerokości width z rollupów, dla kubełków w [start, end)."""
+    model, _ = next((m, w) for m, w in reversed(GRANULARITIES) if width % w == 0)
+    bucket = (model.bucket // width) * width
+    columns = [
+        bucket.label("bucket"),
+        model.count,
+        model.total,
+        model.min_value,
+        model.max_value,
+        func.first_value(model.first_value)
+        .over(partition_by=bucket, order_by=model.first_ts)
+        .label("first_value"),
+        func.last_value(model.last_value)
+        .over(partition_by=bucket, order_by=model.last_ts, rows=(None, None))
+        .label("last_value"),
+    ]
+    inner = select(*columns).where(model.series_id == series_id)
+    if start is not None:
+        inner = inner.where(model.bucket >= start)
+    if end is not None:
+        inner = inner.where(model.bucket < end)
+    sub = inner.subquery()
+
+    agg = {
+        "min": func.min(sub.c.min_value),
+        "max": func.max(sub.c.max_value),
+        "avg": func.sum(sub.c.total) / func.sum(sub.c.count),
+        "count": func.sum(sub.c.count),
+        "first": func.min(sub.c.first_value),
+        "last": func.min(sub.c.last_value),
+    }
+    stmt = (
+        select(sub.c.bucket, *(agg[f] for f in funcs))
+        .group_by(sub.c.bucket)
+        .order_by(sub.c.bucket)
+    )
+
+    result: Dict[str, List[Any]] = {"ts": []}
+    for f in funcs:
+        result[f] = []
+    for row in session.execute(stmt):
+        result["ts"].append(datetime.fromtimestamp(int(row[0]), timezone.utc))
+        for f, v in zip(funcs, row[1:]):
+            result[f].append(v)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Odbudowa tabel rollup z surowych pomiarów")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--series", type=int, default=None, help="tylko wskazana seria")
+    args = parser.parse_args()
+
+    init_db()
+    with Session(engine) as session:
+        total = rebuild(session, args.series)
+        session.commit()
+    print(f"Rollups rebuilt from {total} measurements.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,31 +2,38 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from typing import Optional
+from sqlalchemy import update
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from ..schemas import Token, PasswordChangeRequest
 from ..models import User
-from ..auth import verify_password, create_access_token, hash_password
-from ..db import get_session
-from ..deps import get_current_user
-
-import time
+from ..auth import (
+    PasswordPoolBusy,
+    create_access_token,
+    credential_version,
+    hash_password,
+    password_pool,
+    verify_and_update,
+    verify_password,
+)
+from ..db import engine, get_async_session, read_engine
+from ..deps import Principal, get_principal, invalidate_user, require_admin
+from .. import ratelimit
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-BUCKET: dict[str, list[float]] = {}
-WINDOW = 300
-MAX_TRIES = 10
+
+async def guard_rate_limit(ip: str) -> None:
+    await ratelimit.login_limiter.check_async(ip)
 
 
-def guard_rate_limit(ip: str) -> None:
-    now = time.time()
-    if ip not in BUCKET:
-        BUCKET[ip] = []
-    BUCKET[ip] = [t for t in BUCKET[ip] if now - t < WINDOW]
-    if len(BUCKET[ip]) >= MAX_TRIES:
-        raise HTTPException(status_code=429, detail="Too many login attempts, try later")
-    BUCKET[ip].append(now)
+def _pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent logins, try again shortly",
+        headers={"Retry-After": "1"},
+    )
 
 
 class LoginJSON(BaseModel):
@@ -34,45 +41,84 @@ class LoginJSON(BaseModel):
     password: str
 
 
-def _do_login(username: str, password: str, session: Session) -> Token:
-    user = session.exec(select(User).where(User.username == username)).first()
-    if not user or not verify_password(password, user.password_hash):
+async def _do_login(username: str, password: str, session: AsyncSession) -> Token:
+    user = (await session.exec(select(User).where(User.username == username))).first()
+    if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-    token = create_access_token({"sub": user.username, "role": user.role})
+    # połączenie do zapisu wraca do puli na czas bcrypta (user zostaje załadowany)
+    await session.close()
+    try:
+        valid, new_hash = await password_pool.run(verify_and_update, password, user.password_hash)
+    except PasswordPoolBusy:
+        raise _pool_busy()
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    claims = {"sub": user.username, "role": user.role, "uid": user.id}
+    if new_hash is not None:
+        # zmieniony koszt hashowania - nowy hash zmienia też wersję poświadczeń
+        user.password_hash = new_hash
+        session.add(user)
+        await session.commit()
+        invalidate_user(claims["uid"])
+    token = create_access_token({**claims, "ver": credential_version(new_hash or user.password_hash)})
     return Token(access_token=token, token_type="bearer")
 
 
 @router.post("/login", response_model=Token)
-def login_json(
+async def login_json(
     body: LoginJSON,
     request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     ip = request.client.host if request.client else "unknown"
-    guard_rate_limit(ip)
-    return _do_login(body.username, body.password, session)
+    await guard_rate_limit(ip)
+    return await _do_login(body.username, body.password, session)
 
 
 @router.post("/token", response_model=Token)
-def login_form(
+async def login_form(
     form_data: OAuth2PasswordRequestForm = Depends(),
     request: Request = None,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     ip = request.client.host if request.client else "unknown"
-    guard_rate_limit(ip)
-    return _do_login(form_data.username, form_data.password, session)
+    await guard_rate_limit(ip)
+    return await _do_login(form_data.username, form_data.password, session)
+
+
+@router.get("/rate-limit-stats", dependencies=[Depends(require_admin)])
+def rate_limit_stats():
+    """Liczniki limiterów logowania i zapisu z sensorów."""
+    return ratelimit.stats()
+
+
+@router.get("/password-pool-stats", dependencies=[Depends(require_admin)])
+def password_pool_stats():
+    """Obciążenie puli bcrypt (oczekujące, odrzucone operacje)."""
+    return password_pool.stats()
 
 
 @router.post("/change-password", status_code=204)
 def change_password(
     body: PasswordChangeRequest,
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    principal: Principal = Depends(get_principal),
 ):
-    if not verify_password(body.old_password, current_user.password_hash):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect current password")
-    current_user.password_hash = hash_password(body.new_password)
-    session.add(current_user)
-    session.commit()
+    # bcrypt poza sesją zapisu - jedno połączenie do zapisu (profil performance)
+    # nie czeka na dwa hashowania
+    with Session(read_engine) as session:
+        old_hash = session.exec(select(User.password_hash).where(User.id == principal.id)).one()
+    try:
+        if not password_pool.call(verify_password, body.old_password, old_hash):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect current password")
+        new_hash = password_pool.call(hash_password, body.new_password)
+    except PasswordPoolBusy:
+        raise _pool_busy()
+    with Session(engine) as session:
+        changed = session.execute(
+            update(User).where(User.id == principal.id, User.password_hash == old_hash).values(password_hash=new_hash)
+        ).rowcount
+        session.commit()
+    if not changed:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Password was changed concurrently")
+    invalidate_user(principal.id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
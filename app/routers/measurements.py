@@ -1,16 +1,37 @@
+import asyncio
+import base64
+import csv
+import io
+import itertools
+import os
+import queue
 from datetime import datetime, timezone
-from typing import List, Optional
-
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from pydantic import BaseModel
+from typing import Iterator, List, Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+import orjson
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from sqlalchemy import insert, tuple_
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from ..db import get_session
-from ..deps import require_admin, get_sensor
-from ..models import Measurement, Series, Sensor
+from ..db import get_async_read_session, get_async_session, get_read_session, get_session, read_engine
+from ..deps import require_admin, get_sensor, SensorIdentity
+from ..ingest import ingest_queue, INGEST_DURABILITY, INGEST_QUEUE_ENABLED, INGEST_WAIT_TIMEOUT
+from ..models import Measurement, MeasurementBlock
+from ..series_cache import SeriesInfo, get_series_info
+from ..downsample import downsample_series
+from .. import coldstore, formats, rollups, versions
+from .. import events
 
 router = APIRouter(prefix="/measurements", tags=["measurements"])
 
+SENSOR_BATCH_MAX = int(os.getenv("SENSOR_BATCH_MAX", "1000"))
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "5000"))
+
 
 def to_utc(dt: datetime) -> datetime:
     if dt.tzinfo is None:
@@ -49,24 +70,167 @@ class SensorMeasurementCreate(BaseModel):
     timestamp: Optional[datetime] = None
 
 
-def _ensure_value_in_range(session: Session, series_id: int, value: float) -> Series:
-    series = session.get(Series, series_id)
-    if not series:
-        raise HTTPException(status_code=404, detail="Series not found")
+_sensor_reading = TypeAdapter(SensorMeasurementCreate)
+_sensor_batch = TypeAdapter(List[SensorMeasurementCreate])
+
+
+def _sensor_body_docs(many: bool) -> dict:
+    schema = _sensor_reading.json_schema()
+    if many:
+        schema = {"type": "array", "items": schema}
+    binary = {"schema": {"type": "string", "format": "binary"}}
+    return {"requestBody": {"required": True, "content": {
+        formats.JSON: {"schema": schema},
+        formats.MSGPACK: binary,
+        formats.PACKED: binary,
+    }}}
+
+
+async def _sensor_readings(request: Request, many: bool) -> List[formats.Reading]:
+    """Odczyty z ciała żądania wg Content-Type: JSON (walidacja Pydantic),
+    MessagePack lub packed (wprost do krotek (timestamp, value))."""
+    content_type = formats.media_type(request.headers.get("content-type"))
+    body = await request.body()
+    if content_type == formats.JSON:
+        try:
+            items = (_sensor_batch if many else _sensor_reading).validate_json(body)
+        except ValidationError as e:
+            # bez input (dla json_invalid to surowe bajty ciała) i z ctx jako
+            # tekstem - błędy muszą dać się zserializować w odpowiedzi 422
+            raise RequestValidationError([
+                {
+                    **err,
+                    "loc": ("body", *err["loc"]),
+                    **({"ctx": {k: str(v) for k, v in err["ctx"].items()}} if "ctx" in err else {}),
+                }
+                for err in e.errors(include_url=False, include_input=False)
+            ])
+        return [(item.timestamp, item.value) for item in (items if many else [items])]
+    if content_type not in (formats.MSGPACK, formats.PACKED):
+        raise HTTPException(status_code=415, detail=f"Unsupported content type {content_type}")
+    try:
+        return formats.decode(body, content_type, many)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+async def sensor_reading(request: Request) -> formats.Reading:
+    return (await _sensor_readings(request, many=False))[0]
+
+
+async def sensor_readings(request: Request) -> List[formats.Reading]:
+    return await _sensor_readings(request, many=True)
+
+
+class SensorBatchItemResult(BaseModel):
+    index: int
+    accepted: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class SensorBatchResult(BaseModel):
+    series_id: int
+    accepted: int
+    rejected: int
+    results: List[SensorBatchItemResult]
+
+
+def _as_reading(obj: Measurement) -> dict:
+    return {"id": obj.id, "series_id": obj.series_id, "value": obj.value, "timestamp": obj.timestamp}
+
+
+def _range_error(series: SeriesInfo, value: float) -> Optional[str]:
     if value < series.min_value or value > series.max_value:
-        raise HTTPException(
-            status_code=422,
-            detail=(
-                f"Value {value} out of range "
-                f"[{series.min_value}, {series.max_value}] for series '{series.name}'"
-            ),
+        return (
+            f"Value {value} out of range "
+            f"[{series.min_value}, {series.max_value}] for series '{series.name}'"
         )
+    return None
+
+
+def _ensure_value_in_range(session: Session, series_id: int, value: float) -> SeriesInfo:
+    series = get_series_info(session, series_id)
+    if not series:
+        raise HTTPException(status_code=404, detail="Series not found")
+    error = _range_error(series, value)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
     return series
 
 
+def encode_cursor(ts: datetime, measurement_id: int) -> str:
+    raw = f"{ts.isoformat()}|{measurement_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, measurement_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(measurement_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+# wiersze odczytu bez obiektów ORM: (id, series_id, value, timestamp)
+ReadingRow = tuple[int, int, float, datetime]
+
+
+def _rows_response(
+    rows: List[ReadingRow], shape: str, series_id: Optional[int], headers: dict, fmt: str = formats.JSON
+) -> Response:
+    """Kodowanie przez orjson (lub msgpack/packed wg Accept) z pominięciem
+    walidacji response_model."""
+    headers = {**headers, "Vary": "Accept"}
+    if fmt == formats.PACKED:
+        return Response(formats.encode_packed((r[3], r[2]) for r in rows), media_type=fmt, headers=headers)
+    if shape == "columns":
+        content = {
+            "series_id": series_id if series_id is not None else [r[1] for r in rows],
+            "id": [r[0] for r in rows],
+            "ts": [r[3] for r in rows],
+            "value": [r[2] for r in rows],
+        }
+    else:
+        content = [{"series_id": r[1], "value": r[2], "timestamp": r[3], "id": r[0]} for r in rows]
+    if fmt == formats.MSGPACK:
+        return Response(formats.encode_msgpack(content), media_type=fmt, headers=headers)
+    return ORJSONResponse(content, headers=headers)
+
+
+def _merged_page(
+    session: Session,
+    series_id: Optional[int],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    after: Optional[tuple[datetime, int]],
+    offset: int,
+    limit: int,
+) -> List[ReadingRow]:
+    """Strona pomiarów scalona z gorącej tabeli i zimnych bloków."""
+    stmt = select(Measurement.timestamp, Measurement.id, Measurement.series_id, Measurement.value)
+    if series_id is not None:
+        stmt = stmt.where(Measurement.series_id == series_id)
+    if start is not None:
+        stmt = stmt.where(Measurement.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(Measurement.timestamp <= end)
+    if after is not None:
+        stmt = stmt.where(tuple_(Measurement.timestamp, Measurement.id) > after)
+    stmt = stmt.order_by(Measurement.timestamp.asc(), Measurement.id.asc()).limit(offset + limit)
+    hot = session.execute(stmt)
+    cold = coldstore.iter_readings(session, None if series_id is None else [series_id], start, end, after)
+    return [
+        (mid, sid, value, ts)
+        for ts, mid, sid, value in itertools.islice(coldstore.merge(hot, cold), offset, offset + limit)
+    ]
+
+
 @router.get("", response_model=List[MeasurementRead])
-def list_measurements(
-    session: Session = Depends(get_session),
+async def list_measurements(
+    request: Request,
+    session: AsyncSession = Depends(get_async_read_session),
     series_id: Optional[int] = Query(None),
     ts_from: Optional[datetime] = Query(None),
     ts_to: Optional[datetime] = Query(None),
@@ -74,7 +238,16 @@ def list_measurements(
     until: Optional[datetime] = Query(None),
     limit: int = Query(200, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    max_points: Optional[int] = Query(None, ge=2, le=10000),
+    cursor: Optional[str] = Query(None, description="next_cursor z poprzedniej strony"),
+    shape: Literal["rows", "columns"] = Query("rows", description="columns: {ts: [...], value: [...], ...}"),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
 ):
+    fmt = formats.negotiate(accept)
+    if fmt == formats.PACKED and series_id is None:
+        raise HTTPException(status_code=422, detail="Packed format requires series_id")
     start = ts_from or since
     end = ts_to or until
 
@@ -83,15 +256,122 @@ def list_measurements(
     if end:
         end = to_utc(end)
 
-    stmt = select(Measurement)
+    headers = {}
+    if series_id is not None:
+        # wersja serii zmienia się przy każdym zapisie - powtórka bez zmian kończy się 304
+        row = (await session.execute(versions.version_stmt(series_id))).first()
+        version, modified = row if row else (0, None)
+        tag = versions.etag("measurements", series_id, version, request.url.query, fmt)
+        headers = versions.cache_headers(tag, modified, versions.max_age(end))
+        if versions.not_modified(if_none_match, if_modified_since, tag, modified):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={**headers, "Vary": "Accept"})
+
+    if max_points is not None:
+        if series_id is None:
+            raise HTTPException(status_code=422, detail="max_points requires series_id")
+        rows = await session.run_sync(
+            downsample_series, series_id, max_points, start=start, end=end
+        )
+        return _rows_response(rows, shape, series_id, headers, fmt)
+
+    after = decode_cursor(cursor) if cursor is not None else None
+    blocks = select(MeasurementBlock.id).where(
+        *coldstore.block_filters(None if series_id is None else [series_id], start, end)
+    )
+    if (await session.exec(blocks.limit(1))).first() is not None:
+        rows = await session.run_sync(
+            _merged_page, series_id, start, end, after, 0 if after else offset, limit
+        )
+    else:
+        rows = await _hot_page(session, series_id, start, end, after, offset, limit)
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1][3], rows[-1][0])
+    return _rows_response(rows, shape, series_id, headers, fmt)
+
+
+async def _hot_page(
+    session: AsyncSession,
+    series_id: Optional[int],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    after: Optional[tuple[datetime, int]],
+    offset: int,
+    limit: int,
+) -> List[ReadingRow]:
+    stmt = select(Measurement.id, Measurement.series_id, Measurement.value, Measurement.timestamp)
     if series_id is not None:
         stmt = stmt.where(Measurement.series_id == series_id)
     if start is not None:
         stmt = stmt.where(Measurement.timestamp >= start)
     if end is not None:
         stmt = stmt.where(Measurement.timestamp <= end)
-    stmt = stmt.order_by(Measurement.timestamp.asc()).offset(offset).limit(limit)
-    return session.exec(stmt).all()
+    if after is not None:
+        stmt = stmt.where(tuple_(Measurement.timestamp, Measurement.id) > after)
+    else:
+        stmt = stmt.offset(offset)
+    stmt = stmt.order_by(Measurement.timestamp.asc(), Measurement.id.asc()).limit(limit)
+    return (await session.execute(stmt)).all()
+
+
+def _export_series(conn, series_id: int, start: Optional[datetime], end: Optional[datetime]) -> Iterator[list]:
+    stmt = select(
+        Measurement.timestamp, Measurement.id, Measurement.series_id, Measurement.value
+    ).where(Measurement.series_id == series_id)
+    if start is not None:
+        stmt = stmt.where(Measurement.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(Measurement.timestamp <= end)
+    stmt = stmt.order_by(Measurement.timestamp, Measurement.id)
+    cold = coldstore.has_blocks(conn, [series_id], start, end)
+    result = conn.execution_options(stream_results=True, yield_per=EXPORT_CHUNK).execute(stmt)
+    if not cold:
+        yield from result.partitions()
+        return
+    rows = coldstore.merge(result, coldstore.iter_readings(conn, [series_id], start, end))
+    while chunk := list(itertools.islice(rows, EXPORT_CHUNK)):
+        yield chunk
+
+
+def _export_rows(series_ids: List[int], start: Optional[datetime], end: Optional[datetime], fmt: str) -> Iterator[str]:
+    if fmt == "csv":
+        yield "id,series_id,value,timestamp\n"
+    # sesja z zależności jest zamykana przed wysłaniem odpowiedzi,
+    # więc generator otwiera własne połączenie
+    with read_engine.connect() as conn:
+        for series_id in sorted(set(series_ids)):
+            for chunk in _export_series(conn, series_id, start, end):
+                if fmt == "csv":
+                    buf = io.StringIO()
+                    writer = csv.writer(buf, lineterminator="\n")
+                    writer.writerows((r[1], r[2], r[3], r[0].isoformat()) for r in chunk)
+                    yield buf.getvalue()
+                else:
+                    yield b"".join(
+                        orjson.dumps({"id": r[1], "series_id": r[2], "value": r[3], "timestamp": r[0]}) + b"\n"
+                        for r in chunk
+                    )
+
+
+@router.get("/export")
+def export_measurements(
+    session: Session = Depends(get_read_session),
+    series_id: List[int] = Query(...),
+    ts_from: Optional[datetime] = Query(None, alias="from"),
+    ts_to: Optional[datetime] = Query(None, alias="to"),
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+):
+    """Strumieniowy eksport pomiarów (NDJSON lub CSV) bez stronicowania."""
+    for sid in series_id:
+        if not get_series_info(session, sid):
+            raise HTTPException(status_code=404, detail=f"Series {sid} not found")
+    start = to_utc(ts_from) if ts_from else None
+    end = to_utc(ts_to) if ts_to else None
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_rows(series_id, start, end, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="measurements.{format}"'},
+    )
 
 
 @router.post(
@@ -111,11 +391,30 @@ def create_measurement(
         timestamp=data.as_utc(),
     )
     session.add(obj)
+    _apply_inserts(session, [(obj.series_id, obj.timestamp, obj.value)])
     session.commit()
     session.refresh(obj)
+    events.measurements_committed([_as_reading(obj)])
     return obj
 
 
+def _apply_inserts(session: Session, readings: List[rollups.Reading]) -> None:
+    rollups.apply_inserts(session, readings)
+    versions.bump(session, (r[0] for r in readings))
+
+
+def _recompute_rollups(session: Session, *keys: tuple[int, datetime]) -> None:
+    for series_id, ts in dict.fromkeys(keys):
+        rollups.recompute(session, series_id, ts)
+    versions.bump(session, (series_id for series_id, _ in keys))
+
+
+def _get_measurement(session: Session, measurement_id: int) -> Optional[Measurement]:
+    # odczyt z zimnego bloku wraca do tabeli measurement - zmiana i usunięcie
+    # działają wtedy tak samo jak dla gorących pomiarów
+    return session.get(Measurement, measurement_id) or coldstore.unseal(session, measurement_id)
+
+
 @router.put(
     "/{measurement_id}",
     response_model=MeasurementRead,
@@ -126,16 +425,19 @@ def replace_measurement(
     data: MeasurementCreate,
     session: Session = Depends(get_session),
 ):
-    obj = session.get(Measurement, measurement_id)
+    obj = _get_measurement(session, measurement_id)
     if not obj:
         raise HTTPException(status_code=404, detail="Measurement not found")
     _ensure_value_in_range(session, data.series_id, data.value)
+    old_key = (obj.series_id, obj.timestamp)
     obj.series_id = data.series_id
     obj.value = data.value
     obj.timestamp = data.as_utc()
     session.add(obj)
+    _recompute_rollups(session, old_key, (obj.series_id, obj.timestamp))
     session.commit()
     session.refresh(obj)
+    events.measurements_changed(session, (old_key[0], obj.series_id))
     return obj
 
 
@@ -149,7 +451,7 @@ def update_measurement(
     data: MeasurementUpdate,
     session: Session = Depends(get_session),
 ):
-    obj = session.get(Measurement, measurement_id)
+    obj = _get_measurement(session, measurement_id)
     if not obj:
         raise HTTPException(status_code=404, detail="Measurement not found")
 
@@ -162,12 +464,15 @@ def update_measurement(
     if "timestamp" in payload and payload["timestamp"] is not None:
         payload["timestamp"] = to_utc(payload["timestamp"])
 
+    old_key = (obj.series_id, obj.timestamp)
     for k, v in payload.items():
         setattr(obj, k, v)
 
     session.add(obj)
+    _recompute_rollups(session, old_key, (obj.series_id, obj.timestamp))
     session.commit()
     session.refresh(obj)
+    events.measurements_changed(session, (old_key[0], obj.series_id))
     return obj
 
 
@@ -180,32 +485,136 @@ def delete_measurement(
     measurement_id: int,
     session: Session = Depends(get_session),
 ):
-    obj = session.get(Measurement, measurement_id)
+    obj = _get_measurement(session, measurement_id)
     if not obj:
         return
+    series_id, ts = obj.series_id, obj.timestamp
     session.delete(obj)
+    _recompute_rollups(session, (series_id, ts))
     session.commit()
+    events.measurements_changed(session, (series_id,))
+
+
+async def _enqueue_reading(series_id: int, value: float, ts: datetime):
+    row = {"series_id": series_id, "value": value, "timestamp": ts}
+    try:
+        future = ingest_queue.submit(row)
+    except (queue.Full, RuntimeError):
+        raise HTTPException(status_code=503, detail="Ingestion queue unavailable, try later")
+    if INGEST_DURABILITY == "ack":
+        return JSONResponse(jsonable_encoder(row), status_code=status.HTTP_202_ACCEPTED)
+    try:
+        # shield: timeout nie może anulować przyszłości należącej do writera
+        measurement_id = await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(future)), INGEST_WAIT_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Ingestion flush timed out")
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to store measurement")
+    return MeasurementRead(id=measurement_id, **row)
+
+
+@router.get("/ingest-stats", dependencies=[Depends(require_admin)])
+def ingest_stats():
+    """Stan kolejki zapisu grupowego (głębokość, czasy flushy)."""
+    return ingest_queue.stats()
+
+
+@router.get("/cold-stats", dependencies=[Depends(require_admin)])
+def cold_stats(session: Session = Depends(get_read_session)):
+    """Rozmiar zimnej warstwy (bloki, wiersze, bajty na odczyt)."""
+    return coldstore.stats(session)
 
 
 @router.post(
     "/from-sensor",
     response_model=MeasurementRead,
     status_code=status.HTTP_201_CREATED,
+    openapi_extra=_sensor_body_docs(many=False),
 )
-def create_measurement_from_sensor(
-    data: SensorMeasurementCreate,
-    sensor: Sensor = Depends(get_sensor),
-    session: Session = Depends(get_session),
+async def create_measurement_from_sensor(
+    sensor: SensorIdentity = Depends(get_sensor),
+    reading: formats.Reading = Depends(sensor_reading),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    ts = data.timestamp or datetime.now(timezone.utc)
-    ts = to_utc(ts)
-    _ensure_value_in_range(session, sensor.series_id, data.value)
+    ts, value = reading
+    ts = to_utc(ts or datetime.now(timezone.utc))
+    await session.run_sync(_ensure_value_in_range, sensor.series_id, value)
+    if INGEST_QUEUE_ENABLED:
+        await session.close()
+        return await _enqueue_reading(sensor.series_id, value, ts)
     obj = Measurement(
         series_id=sensor.series_id,
-        value=data.value,
+        value=value,
         timestamp=ts,
     )
     session.add(obj)
-    session.commit()
-    session.refresh(obj)
+    await session.run_sync(_apply_inserts, [(obj.series_id, obj.timestamp, obj.value)])
+    await session.commit()
+    await session.refresh(obj)
+    events.measurements_committed([_as_reading(obj)])
     return obj
+
+
+@router.post(
+    "/from-sensor/batch",
+    response_model=SensorBatchResult,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra=_sensor_body_docs(many=True),
+)
+def create_measurements_from_sensor_batch(
+    sensor: SensorIdentity = Depends(get_sensor),
+    data: List[formats.Reading] = Depends(sensor_readings),
+    session: Session = Depends(get_session),
+):
+    """Zapis wielu odczytów jednego sensora w jednej transakcji.
+
+    Zakres serii sprawdzany jest raz na paczkę; odczyty spoza zakresu są
+    odrzucane pojedynczo zamiast całej paczki.
+    """
+    if not data:
+        raise HTTPException(status_code=422, detail="Batch must contain at least one reading")
+    if len(data) > SENSOR_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large (max {SENSOR_BATCH_MAX} readings)",
+        )
+    series = get_series_info(session, sensor.series_id)
+    if not series:
+        raise HTTPException(status_code=404, detail="Series not found")
+
+    now = datetime.now(timezone.utc)
+    results: List[SensorBatchItemResult] = []
+    rows = []
+    for index, (ts, value) in enumerate(data):
+        error = _range_error(series, value)
+        if error:
+            results.append(SensorBatchItemResult(index=index, accepted=False, error=error))
+            continue
+        results.append(SensorBatchItemResult(index=index, accepted=True))
+        rows.append({
+            "series_id": series.id,
+            "value": value,
+            "timestamp": to_utc(ts or now),
+        })
+
+    if rows:
+        ids = session.scalars(
+            insert(Measurement).returning(Measurement.id, sort_by_parameter_order=True),
+            rows,
+        ).all()
+        _apply_inserts(session, [(r["series_id"], r["timestamp"], r["value"]) for r in rows])
+        session.commit()
+        events.measurements_committed({"id": i, **row} for i, row in zip(ids, rows))
+        accepted = iter(ids)
+        for result in results:
+            if result.accepted:
+                result.id = next(accepted)
+
+    return SensorBatchResult(
+        series_id=series.id,
+        accepted=len(rows),
+        rejected=len(data) - len(rows),
+        results=results,
+    )
@@ -5,9 +5,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from sqlmodel import Session, select
 
-from ..db import get_session
-from ..deps import require_admin
-from ..models import Sensor, Series
+from ..db import get_read_session, get_session
+from ..deps import require_admin, invalidate_sensor_key, sensor_key_cache
+from ..models import Sensor
+from ..series_cache import get_series_info
 
 router = APIRouter(prefix="/sensors", tags=["sensors"])
 
@@ -35,7 +36,7 @@ class SensorWithKey(SensorRead):
     response_model=List[SensorRead],
     dependencies=[Depends(require_admin)],
 )
-def list_sensors(session: Session = Depends(get_session)):
+def list_sensors(session: Session = Depends(get_read_session)):
     """Lista zarejestrowanych sensorów (bez kluczy API)."""
     return session.exec(select(Sensor)).all()
 
@@ -51,7 +52,7 @@ def create_sensor(
     session: Session = Depends(get_session),
 ):
     """Utwórz nowy sensor i wygeneruj dla niego klucz API."""
-    series = session.get(Series, data.series_id)
+    series = get_series_info(session, data.series_id)
     if not series:
         raise HTTPException(status_code=404, detail="Series not found")
 
@@ -65,6 +66,12 @@ def create_sensor(
     session.add(sensor)
     session.commit()
     session.refresh(sensor)
+    invalidate_sensor_key(api_key)
 
+    return SensorWithKey.model_validate(sensor)
 
-    return SensorWithKey.model_validate(sensor)
\ No newline at end of file
+
+@router.get("/cache-stats", dependencies=[Depends(require_admin)])
+def sensor_cache_stats():
+    """Statystyki cache kluczy API sensorów."""
+    return sensor_key_cache.stats()
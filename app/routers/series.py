@@ -1,23 +1,188 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, Response, Query, status
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, Query, WebSocket, WebSocketDisconnect, WebSocketException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete
 from sqlmodel import Session, select, func
-from ..db import get_session
-from ..deps import require_admin
-from ..models import Series, Measurement, Sensor
-from ..schemas import SeriesCreate, SeriesRead, SeriesUpdate
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..db import async_read_engine, get_async_read_session, get_read_session, get_session
+from ..deps import require_admin, invalidate_series_sensors
+from ..models import Series, Measurement, MeasurementBlock, Sensor, RollupMinute, RollupHour
+from ..schemas import SeriesCreate, SeriesRead, SeriesUpdate, MeasurementRead
+from ..series_cache import put_series, drop_series, get_series_info
+from ..aggregates import BUCKETS, aggregate, parse_funcs
+from ..broker import broker, Subscription
+from .. import latest, versions
+from ..retention import retention_worker
+from starlette.concurrency import run_in_threadpool
+from .measurements import to_utc
 
 router = APIRouter(prefix="/series", tags=["series"])
 
+STREAM_KEEPALIVE = float(os.getenv("STREAM_KEEPALIVE", "15"))
+StreamPolicy = Literal["drop_oldest", "latest"]
+
 @router.get("", response_model=List[SeriesRead])
-def list_series(
+async def list_series(
+    request: Request,
     response: Response,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_read_session),
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
 ):
-    total = session.exec(select(func.count(Series.id))).one()
+    row = (await session.execute(versions.version_stmt(versions.CATALOG))).first()
+    version, modified = row if row else (0, None)
+    tag = versions.etag("series", version, request.url.query)
+    headers = versions.cache_headers(tag, modified)
+    if versions.not_modified(if_none_match, if_modified_since, tag, modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    total = (await session.exec(select(func.count(Series.id)))).one()
     response.headers["X-Total-Count"] = str(total)
-    return session.exec(select(Series).order_by(Series.id).offset(offset).limit(limit)).all()
+    return (await session.exec(select(Series).order_by(Series.id).offset(offset).limit(limit))).all()
+
+@router.get("/latest", response_model=List[MeasurementRead])
+async def list_latest():
+    """Ostatni odczyt każdej serii - z pamięci, bez zapytania do bazy."""
+    if latest.refresh_due():
+        await run_in_threadpool(latest.reload)
+    return latest.all_latest()
+
+@router.get("/{series_id}/latest", response_model=MeasurementRead)
+async def get_latest(series_id: int):
+    if latest.refresh_due():
+        await run_in_threadpool(latest.reload)
+    reading = latest.get_latest(series_id)
+    if reading is None:
+        await _ensure_series(series_id)
+        raise HTTPException(status_code=404, detail="No measurements for series")
+    return reading
+
+@router.get("/{series_id}/aggregate")
+def get_series_aggregate(
+    series_id: int,
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
+    ts_from: Optional[datetime] = Query(None, alias="from"),
+    ts_to: Optional[datetime] = Query(None, alias="to"),
+    bucket: Literal["1m", "5m", "1h", "1d"] = Query("1h"),
+    fn: str = Query("min,max,avg,count"),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+) -> Dict[str, Any]:
+    """Agregaty pomiarów serii w przedziałach czasu, zwracane kolumnowo."""
+    if not get_series_info(session, series_id):
+        raise HTTPException(status_code=404, detail="Series not found")
+    try:
+        funcs = parse_funcs(fn)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    version, modified = versions.current(session, series_id)
+    tag = versions.etag("aggregate", series_id, version, request.url.query)
+    headers = versions.cache_headers(tag, modified, versions.max_age(ts_to))
+    if versions.not_modified(if_none_match, if_modified_since, tag, modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    data = aggregate(
+        session,
+        series_id,
+        BUCKETS[bucket],
+        funcs,
+        start=to_utc(ts_from) if ts_from else None,
+        end=to_utc(ts_to) if ts_to else None,
+    )
+    return {"series_id": series_id, "bucket": bucket, **data}
+
+async def _ensure_series(series_id: int) -> None:
+    # krótka sesja - strumień nie może trzymać połączenia przez cały czas trwania
+    async with AsyncSession(async_read_engine) as session:
+        if not await session.run_sync(get_series_info, series_id):
+            raise HTTPException(status_code=404, detail="Series not found")
+
+async def _sse_events(request: Request, sub: Subscription):
+    try:
+        while True:
+            try:
+                reading = await asyncio.wait_for(sub.queue.get(), STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+            data = json.dumps(jsonable_encoder(reading))
+            yield f"id: {reading['id']}\nevent: measurement\ndata: {data}\n\n"
+    finally:
+        broker.unsubscribe(sub)
+
+@router.get("/stream-stats", dependencies=[Depends(require_admin)])
+def stream_stats():
+    """Stan brokera strumieni (subskrypcje, odrzucone odczyty)."""
+    return broker.stats()
+
+@router.get("/retention-stats", dependencies=[Depends(require_admin)])
+def retention_stats():
+    """Stan zadania retencji (przebiegi, usunięte wiersze)."""
+    return retention_worker.stats()
+
+@router.get("/{series_id}/stream")
+async def stream_series(
+    series_id: int,
+    request: Request,
+    replay: int = Query(0, ge=0, le=1000),
+    policy: StreamPolicy = Query("drop_oldest"),
+):
+    """Nowe pomiary serii na żywo (Server-Sent Events)."""
+    await _ensure_series(series_id)
+    sub = broker.subscribe(series_id, replay=replay, policy=policy)
+    return StreamingResponse(
+        _sse_events(request, sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/{series_id}/ws")
+async def stream_series_ws(
+    websocket: WebSocket,
+    series_id: int,
+    replay: int = Query(0, ge=0, le=1000),
+    policy: StreamPolicy = Query("drop_oldest"),
+):
+    """Nowe pomiary serii na żywo (WebSocket)."""
+    try:
+        await _ensure_series(series_id)
+    except HTTPException as e:
+        # przed accept() nie ma odpowiedzi HTTP - odmowa przez zamknięcie handshake
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+    await websocket.accept()
+    sub = broker.subscribe(series_id, replay=replay, policy=policy)
+    # rozłączenie klienta widać tylko przy odbiorze - bez tego cicha seria
+    # trzymałaby subskrypcję w nieskończoność
+    receiver = asyncio.create_task(_wait_ws_disconnect(websocket))
+    try:
+        while True:
+            getter = asyncio.ensure_future(sub.queue.get())
+            await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                getter.cancel()
+                break
+            await websocket.send_json(jsonable_encoder(getter.result()))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        broker.unsubscribe(sub)
+
+async def _wait_ws_disconnect(websocket: WebSocket) -> None:
+    # wiadomości od klienta są ignorowane
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
 
 @router.post(
     "",
@@ -30,8 +195,10 @@ def create_series(data: SeriesCreate, session: Session = Depends(get_session)):
         raise HTTPException(status_code=422, detail="min_value must be <= max_value")
     obj = Series(**data.dict())
     session.add(obj)
+    versions.bump(session, (versions.CATALOG,))
     session.commit()
     session.refresh(obj)
+    put_series(obj)
     return obj
 
 @router.put(
@@ -54,8 +221,10 @@ def update_series(series_id: int, data: SeriesUpdate, session: Session = Depends
         setattr(obj, k, v)
 
     session.add(obj)
+    versions.bump(session, (versions.CATALOG,))
     session.commit()
     session.refresh(obj)
+    put_series(obj)
     return obj
 
 @router.delete(
@@ -64,14 +233,18 @@ def update_series(series_id: int, data: SeriesUpdate, session: Session = Depends
     dependencies=[Depends(require_admin)],
 )
 def delete_series(series_id: int, session: Session = Depends(get_session)):
-    obj = session.get(Series, series_id)
-    if not obj:
+    if session.get(Series, series_id) is None:
         return
-    children_meas = session.exec(select(Measurement).where(Measurement.series_id == series_id)).all()
-    for m in children_meas:
-        session.delete(m)
-    children_sens = session.exec(select(Sensor).where(Sensor.series_id == series_id)).all()
-    for s in children_sens:
-        session.delete(s)
-    session.delete(obj)
-    session.commit()
\ No newline at end of file
+    # usuwanie zbiorowe - bez ładowania pomiarów i czujników do ORM
+    for model in (Measurement, MeasurementBlock, Sensor, RollupMinute, RollupHour):
+        session.execute(
+            delete(model).where(model.series_id == series_id).execution_options(synchronize_session=False)
+        )
+    session.execute(delete(Series).where(Series.id == series_id).execution_options(synchronize_session=False))
+    # wiersz wersji zostaje - ETagi nie wrócą do starych wartości, gdy id zostanie użyte ponownie
+    versions.bump(session, (versions.CATALOG, series_id))
+    session.commit()
+    drop_series(series_id)
+    broker.forget_series(series_id)
+    latest.forget(series_id)
+    invalidate_series_sensors(series_id)
\ No newline at end of file
@@ -27,6 +27,7 @@ class SeriesBase(BaseModel):
     max_value: float
     color: str | None = None
     icon: str | None = None
+    retention_days: int | None = Field(None, ge=1)
 
 class SeriesCreate(SeriesBase): 
     pass
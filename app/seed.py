@@ -7,6 +7,7 @@ from sqlmodel import Session, select
 from .db import engine, init_db
 from .models import User, Series, Measurement, Sensor
 from .auth import hash_password
+from . import rollups, versions
 
 
 def run() -> None:
@@ -57,6 +58,9 @@ def run() -> None:
                     )
                 )
 
+        readings = [(m.series_id, m.timestamp, m.value) for m in s.new if isinstance(m, Measurement)]
+        rollups.apply_inserts(s, readings)
+        versions.bump(s, (r[0] for r in readings))
         s.commit()
 
         if temp:
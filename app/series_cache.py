@@ -0,0 +1,64 @@
+# app/series_cache.py
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from sqlmodel import Session, select
+
+from .models import Series
+
+# Pełne przeładowanie co SERIES_CACHE_TTL sekund ogranicza nieaktualność
+# przy kilku workerach (każdy proces ma własną kopię).
+SERIES_CACHE_TTL = float(os.getenv("SERIES_CACHE_TTL", "60"))
+
+
+class SeriesInfo(NamedTuple):
+    id: int
+    name: str
+    min_value: float
+    max_value: float
+
+
+_series: Dict[int, SeriesInfo] = {}
+_loaded_at: float | None = None
+_lock = threading.Lock()
+
+
+def _info(obj: Series) -> SeriesInfo:
+    return SeriesInfo(obj.id, obj.name, obj.min_value, obj.max_value)
+
+
+def load_all(session: Session) -> None:
+    global _loaded_at
+    rows = session.exec(
+        select(Series.id, Series.name, Series.min_value, Series.max_value)
+    ).all()
+    with _lock:
+        _series.clear()
+        _series.update({row[0]: SeriesInfo(*row) for row in rows})
+        _loaded_at = time.monotonic()
+
+
+def get_series_info(session: Session, series_id: int) -> Optional[SeriesInfo]:
+    """Opis serii z pamięci; przy braku wpisu (lub wygaśnięciu cache) z bazy."""
+    if _loaded_at is None or time.monotonic() - _loaded_at > SERIES_CACHE_TTL:
+        load_all(session)
+    info = _series.get(series_id)
+    if info is not None:
+        return info
+    obj = session.get(Series, series_id)
+    if obj is None:
+        return None
+    put_series(obj)
+    return _info(obj)
+
+
+def put_series(obj: Series) -> None:
+    with _lock:
+        _series[obj.id] = _info(obj)
+
+
+def drop_series(series_id: int) -> None:
+    with _lock:
+        _series.pop(series_id, None)
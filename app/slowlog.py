@@ -0,0 +1,225 @@
+# app/slowlog.py
+# Log wolnych zapytań: instrukcje SQL trwające co najmniej SLOW_QUERY_MS
+# trafiają do logu i do ograniczonego bufora (GET /slow-queries, admin)
+# razem z parametrami (wrażliwe zamaskowane), czasem, trasą HTTP i planem
+# zapytania - EXPLAIN QUERY PLAN (SQLite) / EXPLAIN (PostgreSQL), liczonym
+# raz na kształt instrukcji. SLOW_QUERY_MS=0 wyłącza log.
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import Depends, FastAPI, Query
+from sqlalchemy import event
+
+from .db import all_engines
+from .deps import require_admin
+from .metrics import statement_shape
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1").lower() in ("1", "true", "yes")
+# ile różnych kształtów zapytań trzyma cache planów
+SLOW_QUERY_PLAN_CACHE = int(os.getenv("SLOW_QUERY_PLAN_CACHE", "500"))
+SLOW_QUERY_MAX_ROWS = 5  # executemany: tyle zestawów parametrów w logu
+
+log = logging.getLogger("app.slowlog")
+
+_SECRET_NAME = re.compile(r"pass|secret|token|api_?key|hash", re.IGNORECASE)
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+REDACTED = "***"
+BACKGROUND = "<background>"
+
+current_route: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_route", default=None)
+
+
+def _value(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str) and len(value) > 200:
+        return value[:200] + "..."
+    return value
+
+
+def redact(parameters: Any, names: Optional[List[str]]) -> Any:
+    """Parametry do logu; wartości parametrów o nazwach jak hasło/klucz/token
+    są maskowane. Dla parametrów pozycyjnych nazwy biorą się ze skompilowanej
+    instrukcji (names); bez nich maskowane są wszystkie napisy."""
+    if isinstance(parameters, dict):
+        return {k: REDACTED if _SECRET_NAME.search(k) else _value(v) for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if names is not None and len(names) == len(parameters):
+            return [REDACTED if _SECRET_NAME.search(n) else _value(v) for n, v in zip(names, parameters)]
+        return [REDACTED if isinstance(v, str) else _value(v) for v in parameters]
+    return parameters
+
+
+def _bind_names(context) -> Optional[List[str]]:
+    compiled = getattr(context, "compiled", None)
+    names = getattr(compiled, "positiontup", None)
+    return list(names) if names else None
+
+
+def _render_plan(dialect: str, rows: List[tuple]) -> List[str]:
+    if dialect != "sqlite":
+        return [str(r[0]) for r in rows]
+    # (id, parent, notused, detail) - drzewo planu z wcięciami
+    depth: Dict[int, int] = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + str(detail))
+    return lines
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, size: int, explain: bool):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self._entries: "deque[Dict[str, Any]]" = deque(maxlen=size)
+        self._plans: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def _plan(self, conn, shape: str, statement: str, parameters: Any) -> Optional[List[str]]:
+        with self._lock:
+            plan = self._plans.get(shape)
+        if plan is not None or not self.explain:
+            return plan
+        if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        dialect = conn.dialect.name
+        prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+        # surowy kursor DBAPI - bez zdarzeń SQLAlchemy i bez wpływu na bieżący wynik
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = _render_plan(dialect, cursor.fetchall())
+        except Exception as exc:
+            plan = [f"EXPLAIN failed: {exc!r}"]
+        finally:
+            cursor.close()
+        with self._lock:
+            self._plans[shape] = plan
+            while len(self._plans) > SLOW_QUERY_PLAN_CACHE:
+                self._plans.popitem(last=False)
+        return plan
+
+    def record(self, conn, statement: str, parameters: Any, context, executemany: bool, duration_ms: float) -> None:
+        request = current_route.get()
+        route = BACKGROUND
+        if request is not None:
+            route_obj = request.get("route")
+            route = f"{request['method']} {getattr(route_obj, 'path', request['path'])}"
+        names = _bind_names(context)
+        if executemany:
+            rows = list(parameters)
+            logged = {"rows": len(rows), "first": [redact(p, names) for p in rows[:SLOW_QUERY_MAX_ROWS]]}
+            first = rows[0] if rows else ()
+        else:
+            logged, first = redact(parameters, names), parameters
+        shape = statement_shape(statement)
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(duration_ms, 3),
+            "route": route,
+            "statement": " ".join(statement.split()),
+            "parameters": logged,
+            "executemany": executemany,
+            "plan": self._plan(conn, shape, statement, first),
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self.total += 1
+        log.warning(
+            "slow query %.1f ms [%s]: %s params=%s plan=%s",
+            duration_ms, route, entry["statement"][:500], logged, " | ".join(entry["plan"] or []),
+        )
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._entries)
+        items.reverse()  # najnowsze pierwsze
+        return items[:limit] if limit else items
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._plans.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threshold_ms": self.threshold_ms,
+                "explain": self.explain,
+                "recorded": self.total,
+                "buffered": len(self._entries),
+                "buffer_size": self._entries.maxlen,
+                "plans_cached": len(self._plans),
+            }
+
+
+slow_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_EXPLAIN)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slowlog_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("slowlog_start")
+    if not starts:
+        return
+    duration_ms = (time.perf_counter() - starts.pop()) * 1000
+    if duration_ms >= slow_log.threshold_ms:
+        try:
+            slow_log.record(conn, statement, parameters, context, executemany, duration_ms)
+        except Exception:
+            log.exception("slow query log failed")
+
+
+def _handle_error(context):
+    starts = context.connection.info.get("slowlog_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+class RequestRouteMiddleware:
+    """Udostępnia scope żądania zapytaniom SQL (trasa jest w nim po routingu)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = current_route.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_route.reset(token)
+
+
+def install(app: FastAPI) -> None:
+    """Zdarzenia silników, middleware i endpointy admina; przed startem aplikacji."""
+    for eng in all_engines():
+        event.listen(eng, "before_cursor_execute", _before_cursor_execute)
+        event.listen(eng, "after_cursor_execute", _after_cursor_execute)
+        event.listen(eng, "handle_error", _handle_error)
+    app.add_middleware(RequestRouteMiddleware)
+
+    @app.get("/slow-queries", tags=["admin"], dependencies=[Depends(require_admin)])
+    def list_slow_queries(limit: int = Query(50, ge=1, le=1000)):
+        """Ostatnie wolne zapytania (najnowsze pierwsze) z planami wykonania."""
+        return {**slow_log.stats(), "entries": slow_log.entries(limit)}
+
+    @app.delete("/slow-queries", status_code=204, tags=["admin"], dependencies=[Depends(require_admin)])
+    def clear_slow_queries():
+        slow_log.clear()
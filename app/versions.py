@@ -0,0 +1,95 @@
+# app/versions.py
+# Licznik wersji zapisów per seria (series_version) - podstawa ETag/Last-Modified.
+# Podbijany w tej samej transakcji co zapis, więc wszystkie workery widzą
+# tę samą wersję; wiersz CATALOG opisuje listę serii (create/update/delete).
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session
+
+from .db import IS_SQLITE
+from .models import SeriesVersion
+
+CATALOG = 0
+# max-age dla zapytań o zamknięty zakres w przeszłości
+HTTP_CACHE_HISTORICAL_MAX_AGE = int(os.getenv("HTTP_CACHE_HISTORICAL_MAX_AGE", "86400"))
+
+Version = Tuple[int, Optional[datetime]]
+
+
+def bump(session: Session, series_ids: Iterable[int]) -> None:
+    """Podbija wersje serii; wywoływać przed commitem zapisu."""
+    now = datetime.now(timezone.utc)
+    rows = [{"series_id": sid, "version": 1, "updated_at": now} for sid in sorted(set(series_ids))]
+    if not rows:
+        return
+    table = SeriesVersion.__table__
+    stmt = (sqlite_insert if IS_SQLITE else pg_insert)(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.series_id],
+        set_={"version": table.c.version + 1, "updated_at": stmt.excluded.updated_at},
+    )
+    session.execute(stmt, rows)
+
+
+def max_age(end: Optional[datetime]) -> int:
+    """Zakres zamknięty w przeszłości nie zmieni się bez zapisu - może być
+    dłużej cache'owany; pozostałe odpowiedzi zawsze rewalidowane."""
+    if end is None:
+        return 0
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    return HTTP_CACHE_HISTORICAL_MAX_AGE if end < datetime.now(timezone.utc) else 0
+
+
+def version_stmt(series_id: int):
+    return select(SeriesVersion.version, SeriesVersion.updated_at).where(SeriesVersion.series_id == series_id)
+
+
+def current(session: Session, series_id: int) -> Version:
+    row = session.execute(version_stmt(series_id)).first()
+    return (row[0], row[1]) if row else (0, None)
+
+
+def etag(*parts: Any) -> str:
+    digest = hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def cache_headers(tag: str, modified: Optional[datetime], max_age: int = 0) -> Dict[str, str]:
+    headers = {
+        "ETag": tag,
+        "Cache-Control": f"public, max-age={max_age}" if max_age > 0 else "no-cache",
+    }
+    if modified is not None:
+        if modified.tzinfo is None:
+            modified = modified.replace(tzinfo=timezone.utc)
+        headers["Last-Modified"] = format_datetime(modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def not_modified(
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+    tag: str,
+    modified: Optional[datetime],
+) -> bool:
+    """Warunkowy GET (RFC 9110): If-None-Match ma pierwszeństwo przed If-Modified-Since."""
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or tag in tags or f"W/{tag}" in tags
+    if if_modified_since is None or modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if modified.tzinfo is None:
+        modified = modified.replace(tzinfo=timezone.utc)
+    return modified.replace(microsecond=0) <= since
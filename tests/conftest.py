@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# baza tymczasowa musi być ustawiona przed importem app.db
+_tmpdir = tempfile.mkdtemp(prefix="tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir}/test.sqlite"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlmodel import Session, select  # noqa: E402
+
+from app import seed  # noqa: E402
+from app.db import engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Measurement, Sensor, Series  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as c:
+        seed.run()
+        yield c
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    r = client.post("/auth/login", json={"username": "admin", "password": "admin123"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def sensor_headers(client):
+    with Session(engine) as session:
+        return {"X-Sensor-Key": session.exec(select(Sensor)).first().api_key}
+
+
+@pytest.fixture
+def new_series(client):
+    """Nowa seria z podanymi odczytami [(timestamp, value), ...]; zwraca id."""
+
+    def make(readings=()):
+        with Session(engine) as session:
+            series = Series(name=f"test-{uuid.uuid4().hex[:8]}", min_value=-1e6, max_value=1e6)
+            session.add(series)
+            session.commit()
+            session.add_all(Measurement(series_id=series.id, value=v, timestamp=ts) for ts, v in readings)
+            session.commit()
+            return series.id
+
+    return make
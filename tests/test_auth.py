@@ -0,0 +1,38 @@
+import uuid
+
+from sqlmodel import Session
+
+from app.auth import hash_password, password_pool
+from app.db import engine
+from app.models import User
+
+
+def _login(client, username, password):
+    return client.post("/auth/login", json={"username": username, "password": password})
+
+
+def test_change_password_runs_bcrypt_outside_writer_session(client, monkeypatch):
+    username = f"user-{uuid.uuid4().hex[:8]}"
+    with Session(engine) as session:
+        session.add(User(username=username, password_hash=hash_password("old-secret"), role="viewer"))
+        session.commit()
+    headers = {"Authorization": f"Bearer {_login(client, username, 'old-secret').json()['access_token']}"}
+
+    checked_out = []
+    call = password_pool.call
+
+    def spy(fn, *args):
+        checked_out.append(engine.pool.checkedout())
+        return call(fn, *args)
+
+    monkeypatch.setattr(password_pool, "call", spy)
+    body = {"old_password": "wrong", "new_password": "new-secret"}
+    assert client.post("/auth/change-password", json=body, headers=headers).status_code == 400
+    body["old_password"] = "old-secret"
+    assert client.post("/auth/change-password", json=body, headers=headers).status_code == 204
+    assert checked_out == [0, 0, 0]
+
+    assert _login(client, username, "old-secret").status_code == 401
+    assert _login(client, username, "new-secret").status_code == 200
+    # stary token nosi poprzednią wersję poświadczeń
+    assert client.post("/auth/change-password", json=body, headers=headers).status_code == 401
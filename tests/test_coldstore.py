@@ -0,0 +1,165 @@
+import math
+import random
+import struct
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlmodel import Session, select
+
+from app import coldstore, gorilla, latest, rollups
+from app.aggregates import aggregate, aggregate_series
+from app.db import engine
+from app.models import MeasurementBlock
+
+
+def _bits(values):
+    return [struct.pack(">d", v) for v in values]
+
+
+def _roundtrip(ids, stamps, values):
+    got_ids, got_stamps, got_values = gorilla.decode(gorilla.encode(ids, stamps, values))
+    assert got_ids == list(ids)
+    assert got_stamps == list(stamps)
+    # porównanie bitowe: NaN != NaN, a 0.0 == -0.0
+    assert _bits(got_values) == _bits(values)
+
+
+def test_gorilla_roundtrip_special_values():
+    values = [0.0, -0.0, float("nan"), float("inf"), -float("inf"), 1e-308, 5e-324, -1.5, 1.7976931348623157e308, 0.1]
+    stamps = [1_700_000_000_000_000 + i * 1_000_000 for i in range(len(values))]
+    _roundtrip(range(100, 100 + len(values)), stamps, values)
+    values = [float("nan")] * 3 + [-0.0, 0.0, -0.0]
+    _roundtrip([1, 5, 3, 2, 9, 4], stamps[:6], values)
+
+
+def test_gorilla_roundtrip_timestamp_deltas():
+    # delta-of-delta z każdej klasy, także poza 32-bitowym kubełkiem
+    deltas = [1, 1, 1, 64, -63, 255, -256, 2047, -2048, 2**31, -(2**31) + 1, 2**40, 3, 2**50, 0, -(2**45)]
+    stamps, ts = [], -(2**52)
+    for d in deltas:
+        ts += d
+        stamps.append(ts)
+    stamps.sort()
+    _roundtrip(range(len(stamps)), stamps, [float(i) for i in range(len(stamps))])
+    _roundtrip([7], [-123], [42.0])
+    _roundtrip([], [], [])
+
+
+def test_gorilla_roundtrip_random():
+    rnd = random.Random(17)
+    stamps = sorted(rnd.randrange(0, 2**62) for _ in range(500))
+    values = [rnd.choice([rnd.uniform(-1e9, 1e9), 20.5, math.pi, rnd.random()]) for _ in range(500)]
+    ids = [rnd.randrange(1, 2**40) for _ in range(500)]
+    _roundtrip(ids, stamps, values)
+
+
+def test_gorilla_rejects_unknown_version():
+    with pytest.raises(ValueError):
+        gorilla.decode(bytes([gorilla.VERSION + 1, 0]))
+
+
+def test_sealed_readings_read_like_hot_ones(client, new_series):
+    t0 = datetime(2024, 4, 1, tzinfo=timezone.utc)
+    series_id = new_series([(t0 + timedelta(minutes=17 * i), float(i % 11)) for i in range(300)])
+    with Session(engine) as session:
+        rollups.rebuild(session, series_id)
+        session.commit()
+    params = {"series_id": series_id, "limit": 1000}
+    before = client.get("/measurements", params=params).json()
+    with Session(engine) as session:
+        hot_aggregate = aggregate(session, series_id, 3600, ["min", "max", "avg", "count", "first", "last"])
+
+    with Session(engine) as session:
+        cutoff = t0 + timedelta(days=2)
+        while coldstore.seal_window(session, series_id, cutoff):
+            session.commit()
+        session.commit()
+        assert coldstore.has_blocks(session, [series_id])
+
+    assert client.get("/measurements", params=params).json() == before
+    paged, cursor = [], None
+    while True:
+        r = client.get("/measurements", params={**params, "limit": 70, **({"cursor": cursor} if cursor else {})})
+        paged += r.json()
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert paged == before
+    with Session(engine) as session:
+        cold_aggregate = aggregate(session, series_id, 3600, ["min", "max", "avg", "count", "first", "last"])
+    assert cold_aggregate["ts"] == hot_aggregate["ts"]
+    for key in ("min", "max", "count", "first", "last"):
+        assert cold_aggregate[key] == hot_aggregate[key]
+    assert cold_aggregate["avg"] == pytest.approx(hot_aggregate["avg"])
+
+
+@pytest.fixture
+def sealed_series(client, new_series):
+    t0 = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    series_id = new_series([(t0 + timedelta(minutes=10 * i), float(i % 7)) for i in range(60)])
+    with Session(engine) as session:
+        rollups.rebuild(session, series_id)
+        while coldstore.seal_window(session, series_id, t0 + timedelta(days=30)):
+            session.commit()
+        session.commit()
+        latest.refresh_series(session, series_id)
+    return series_id
+
+
+def _listed(client, series_id):
+    return {m["id"]: m for m in client.get("/measurements", params={"series_id": series_id, "limit": 1000}).json()}
+
+
+def _assert_rollups_match_raw(series_id):
+    with Session(engine) as session:
+        raw = aggregate_series(session, series_id, 3600, ["min", "max", "count", "first", "last"])
+        rolled = aggregate(session, series_id, 3600, ["min", "max", "count", "first", "last"])
+    assert rolled == raw
+
+
+def test_delete_sealed_reading(client, admin_headers, sealed_series):
+    listed = _listed(client, sealed_series)
+    last = max(listed.values(), key=lambda m: (m["timestamp"], m["id"]))
+    assert client.get(f"/series/{sealed_series}/latest").json()["id"] == last["id"]
+
+    assert client.delete(f"/measurements/{last['id']}", headers=admin_headers).status_code == 204
+    after = _listed(client, sealed_series)
+    assert last["id"] not in after and len(after) == 59
+    export = client.get("/measurements/export", params={"series_id": sealed_series, "format": "csv"}).text
+    assert f",{last['id']}," not in export and len(export.strip().splitlines()) == 60
+    assert client.get(f"/series/{sealed_series}/latest").json()["id"] != last["id"]
+    _assert_rollups_match_raw(sealed_series)
+    with Session(engine) as session:
+        assert coldstore.find(session, last["id"]) is None
+        assert sum(b.count for b in coldstore.blocks(session, [sealed_series])) == 59
+
+
+def test_patch_and_put_sealed_reading(client, admin_headers, sealed_series):
+    listed = _listed(client, sealed_series)
+    first, other = sorted(listed)[5], sorted(listed)[30]
+
+    r = client.patch(f"/measurements/{first}", json={"value": 123.0}, headers=admin_headers)
+    assert r.status_code == 200 and r.json()["id"] == first
+    assert _listed(client, sealed_series)[first]["value"] == 123.0
+
+    moved = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    body = {"series_id": sealed_series, "value": -4.0, "timestamp": moved.isoformat()}
+    r = client.put(f"/measurements/{other}", json=body, headers=admin_headers)
+    assert r.status_code == 200
+    after = _listed(client, sealed_series)
+    assert len(after) == 60
+    assert after[other]["value"] == -4.0 and after[other]["timestamp"].startswith("2024-06-01T00:00:00")
+    assert client.get(f"/series/{sealed_series}/latest").json()["id"] == other
+    _assert_rollups_match_raw(sealed_series)
+
+
+def test_write_to_unknown_id(client, admin_headers):
+    assert client.patch("/measurements/987654321", json={"value": 1.0}, headers=admin_headers).status_code == 404
+
+
+def test_new_readings_never_reuse_sealed_ids(client, sealed_series, new_series):
+    with Session(engine) as session:
+        sealed_max = max(b.max_id for b in session.exec(select(MeasurementBlock)).all())
+    series_id = new_series([(datetime(2024, 7, 1, tzinfo=timezone.utc), 1.0)])
+    (reading,) = client.get("/measurements", params={"series_id": series_id}).json()
+    assert reading["id"] > sealed_max
@@ -0,0 +1,50 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from app.downsample import minmax_decimate
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _points(n, seed=1):
+    rnd = random.Random(seed)
+    return [(i, T0 + timedelta(seconds=i), rnd.uniform(-100, 100)) for i in range(n)]
+
+
+def test_minmax_keeps_bucket_extremes_within_max_points():
+    points = _points(1000)
+    start, end = points[0][1].timestamp(), points[-1][1].timestamp()
+    for max_points in (2, 3, 10, 64, 999):
+        out = minmax_decimate(iter(points), start, end, max_points)
+        assert len(out) <= max_points
+        assert out == sorted(out, key=lambda p: (p[1], p[0]))
+        buckets = max(1, max_points // 2)
+        for b in range(buckets):
+            members = [p for p in points if min(buckets - 1, int((p[1].timestamp() - start) / (end - start) * buckets)) == b]
+            assert min(members, key=lambda p: p[2]) in out
+            assert max(members, key=lambda p: p[2]) in out
+
+
+def test_minmax_single_point_and_constant_series():
+    (p,) = _points(1)
+    assert minmax_decimate([p], p[1].timestamp(), p[1].timestamp(), 10) == [p]
+    flat = [(i, T0 + timedelta(seconds=i), 5.0) for i in range(100)]
+    out = minmax_decimate(flat, flat[0][1].timestamp(), flat[-1][1].timestamp(), 10)
+    assert len(out) == 5
+    assert all(p[2] == 5.0 for p in out)
+
+
+def test_max_points_endpoint_returns_extremes(client, new_series):
+    readings = [(T0 + timedelta(seconds=i), float((i * 37) % 101)) for i in range(500)]
+    readings[123] = (readings[123][0], -50.0)
+    readings[321] = (readings[321][0], 500.0)
+    series_id = new_series(readings)
+
+    r = client.get("/measurements", params={"series_id": series_id, "max_points": 20})
+    assert r.status_code == 200
+    values = [m["value"] for m in r.json()]
+    assert len(values) <= 20
+    assert -50.0 in values and 500.0 in values
+
+    r = client.get("/measurements", params={"series_id": series_id, "max_points": 1000})
+    assert len(r.json()) == 500
@@ -0,0 +1,67 @@
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+from sqlalchemy.exc import OperationalError
+
+from app import ingest
+from app.ingest import IngestQueue
+
+
+def _pending(series_id, value):
+    return {"series_id": series_id, "value": value, "timestamp": datetime.now(timezone.utc)}, Future()
+
+
+def test_bad_row_does_not_fail_the_whole_flush(client):
+    q = IngestQueue(flush_rows=10, flush_ms=1, max_size=10)
+    batch = [_pending(1, 20.0), _pending(1, 21.0), _pending(999999, 22.0), _pending(1, 23.0)]
+    q._flush(batch)
+    ids = [future.result() for _, future in batch if future.exception() is None]
+    assert len(ids) == 3 and all(isinstance(i, int) for i in ids)
+    assert batch[2][1].exception() is not None
+    stats = q.stats()
+    assert stats["rows_flushed"] == 3
+    assert stats["rows_failed"] == 1
+
+
+def test_lost_acknowledged_rows_are_logged(client, monkeypatch, caplog):
+    monkeypatch.setattr(ingest, "INGEST_DURABILITY", "ack")
+    q = IngestQueue(flush_rows=10, flush_ms=1, max_size=10)
+    q._flush([_pending(999999, 22.0), _pending(1, 23.0)])
+    assert "lost 1 of 2 acknowledged readings" in caplog.text
+
+
+def _locked(*args, **kwargs):
+    raise OperationalError("INSERT INTO measurement ...", {}, Exception("database is locked"))
+
+
+def test_operational_error_retries_whole_batch(client, monkeypatch):
+    monkeypatch.setattr(ingest, "INGEST_RETRY_MS", 0)
+    q = IngestQueue(flush_rows=10, flush_ms=1, max_size=10)
+    calls = []
+    insert = q._insert
+
+    def flaky(batch):
+        calls.append(len(batch))
+        if len(calls) < 3:
+            _locked()
+        return insert(batch)
+
+    monkeypatch.setattr(q, "_insert", flaky)
+    batch = [_pending(1, 20.0 + i) for i in range(8)]
+    q._flush(batch)
+    assert calls == [8, 8, 8]
+    assert all(isinstance(future.result(), int) for _, future in batch)
+
+
+def test_persistent_operational_error_fails_batch_without_splitting(client, monkeypatch, caplog):
+    monkeypatch.setattr(ingest, "INGEST_RETRY_MS", 0)
+    monkeypatch.setattr(ingest, "INGEST_RETRIES", 2)
+    q = IngestQueue(flush_rows=10, flush_ms=1, max_size=10)
+    calls = []
+    monkeypatch.setattr(q, "_insert", lambda batch: calls.append(len(batch)) or _locked())
+    batch = [_pending(1, 20.0 + i) for i in range(8)]
+    q._flush(batch)
+    assert calls == [8, 8, 8]
+    assert all(isinstance(future.exception(), OperationalError) for _, future in batch)
+    assert q.stats()["rows_failed"] == 8
+    assert sum(r.exc_info is not None for r in caplog.records) == 1
@@ -0,0 +1,26 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import metrics
+
+
+def test_in_flight_gauge_is_labelled_by_route():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware, router=app.router)
+    seen = {}
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        seen.update(metrics.registry.in_flight)
+        return {}
+
+    client = TestClient(app)
+    assert client.get("/items/7").status_code == 200
+    assert client.get("/nope").status_code == 404
+
+    assert seen[("GET", "/items/{item_id}")] == 1
+    assert metrics.registry.in_flight[("GET", "/items/{item_id}")] == 0
+    assert metrics.registry.in_flight[("GET", metrics.UNMATCHED)] == 0
+    assert metrics.registry.requests[("GET", metrics.UNMATCHED, 404)] >= 1
+    rendered = metrics.registry.render()
+    assert 'http_requests_in_flight{method="GET",route="/items/{item_id}"} 0' in rendered
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session
+
+from app.db import engine
+from app.models import Measurement
+
+T0 = datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+
+def _ids(response):
+    return [m["id"] for m in response.json()]
+
+
+def test_cursor_pages_match_offset_pages_under_concurrent_inserts(client, new_series):
+    # kilka odczytów z tym samym znacznikiem czasu - kolejność rozstrzyga id
+    series_id = new_series([(T0 + timedelta(seconds=i // 2), float(i)) for i in range(47)])
+    params = {"series_id": series_id, "limit": 10}
+    expected = []
+    for offset in range(0, 50, 10):
+        expected += _ids(client.get("/measurements", params={**params, "offset": offset}))
+    assert len(expected) == 47
+
+    pages, cursor, inserted = [], None, 0
+    while True:
+        r = client.get("/measurements", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200
+        pages += _ids(r)
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        # nowe odczyty przed pozycją kursora przesuwają strony OFFSET, nie kursora
+        with Session(engine) as session:
+            session.add(Measurement(series_id=series_id, value=-1.0, timestamp=T0 - timedelta(minutes=inserted + 1)))
+            session.commit()
+        inserted += 1
+
+    assert pages == expected
+    assert inserted == 4
+    shifted = _ids(client.get("/measurements", params={**params, "offset": 10}))
+    assert shifted != expected[10:20]
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/measurements", params={"cursor": "not-a-cursor"}).status_code == 422
@@ -0,0 +1,74 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from app import db
+from app.db import engine
+from app.ratelimit import DatabaseBackend, MemoryBackend, RateLimiter, make_backend
+
+
+def _limiter(backend, limit=5, window=10.0):
+    return RateLimiter(f"test-{uuid.uuid4().hex[:8]}", limit, window, backend)
+
+
+@pytest.fixture(params=["memory", "database"])
+def backend(request, client):
+    return MemoryBackend(1000) if request.param == "memory" else DatabaseBackend(engine)
+
+
+@pytest.mark.parametrize("prev_hits,curr_hits,f", [(0, 5, 0.3), (5, 0, 0.1), (5, 2, 0.5), (3, 5, 0.9), (8, 1, 0.05)])
+def test_retry_after_is_exactly_when_next_hit_is_allowed(prev_hits, curr_hits, f):
+    limiter = _limiter(MemoryBackend(1000), limit=5, window=10.0)
+    # poprzednie okno [0, 10), bieżące [10, 20); wpisujemy liczniki wprost
+    limiter.backend._data[limiter._prefix + "k"] = (1, prev_hits, curr_hits)
+    now = 10.0 + f * 10.0
+    decision = limiter.hit("k", now=now)
+    assert not decision.allowed
+    assert decision.retry_after > 0
+    assert not limiter.hit("k", now=now + decision.retry_after - 0.01).allowed
+    assert limiter.hit("k", now=now + decision.retry_after + 1e-6).allowed
+
+
+def test_limit_boundary(backend):
+    limiter = _limiter(backend, limit=3, window=10.0)
+    now = 1000.0
+    decisions = [limiter.hit("k", now=now + i * 0.1) for i in range(5)]
+    assert [d.allowed for d in decisions] == [True, True, True, False, False]
+    assert [d.remaining for d in decisions] == [2, 1, 0, 0, 0]
+    # odrzucone próby nie są liczone: po 10 s poprzednie okno waży 1 - f
+    assert limiter.hit("k", now=1010.0).allowed is False
+    assert limiter.hit("k", now=1010.0 + 10 / 3 + 0.01).allowed
+    assert limiter.hit("other", now=now).allowed
+    assert limiter.stats()["rejected"] == 3
+
+
+def test_database_backend_counts_are_shared(client):
+    name = f"test-{uuid.uuid4().hex[:8]}"
+    a = RateLimiter(name, 2, 60.0, DatabaseBackend(engine))
+    b = RateLimiter(name, 2, 60.0, DatabaseBackend(engine))
+    assert a.hit("k", now=120.0).allowed
+    assert b.hit("k", now=121.0).allowed
+    assert not a.hit("k", now=122.0).allowed
+    a.reset()
+    assert b.hit("k", now=123.0).allowed
+
+
+def test_check_raises_429_with_retry_after():
+    limiter = _limiter(MemoryBackend(1000), limit=1)
+    limiter.check("k")
+    with pytest.raises(HTTPException) as exc:
+        limiter.check("k")
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) >= 1
+
+
+def test_database_backend_bypasses_the_writer_lock(client):
+    # profil performance: zapis limitera nie czeka na połączenie do zapisu
+    limiter = _limiter(make_backend("database"), limit=1)
+    assert db._writer_lock.acquire(timeout=1)
+    try:
+        assert limiter.hit("k").allowed
+        assert not limiter.hit("k").allowed
+    finally:
+        db._writer_lock.release()
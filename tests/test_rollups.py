@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlmodel import Session
+
+from app import rollups
+from app.aggregates import AGG_FUNCS, aggregate, aggregate_series
+from app.db import engine
+
+T0 = datetime(2024, 3, 1, tzinfo=timezone.utc)
+FUNCS = list(AGG_FUNCS)
+
+
+def _assert_same(series_id, width, start, end):
+    with Session(engine) as session:
+        expected = aggregate_series(session, series_id, width, FUNCS, start, end)
+        actual = aggregate(session, series_id, width, FUNCS, start, end)
+    assert actual["ts"] == expected["ts"]
+    for f in FUNCS:
+        assert actual[f] == pytest.approx(expected[f]), f
+
+
+@pytest.fixture
+def rolled_series(new_series):
+    # odczyt co 7 s przez ~3 h: kubełki minutowe i godzinne nie są wyrównane do danych
+    series_id = new_series([(T0 + timedelta(seconds=7 * i), float((i * 13) % 29) - 10) for i in range(1600)])
+    with Session(engine) as session:
+        rollups.rebuild(session, series_id)
+        session.commit()
+    return series_id
+
+
+RANGES = [
+    (None, None),
+    (T0 + timedelta(seconds=95), T0 + timedelta(hours=2, seconds=17)),
+    (T0 + timedelta(minutes=30, seconds=1), T0 + timedelta(minutes=30, seconds=50)),
+    (T0 - timedelta(hours=1), T0 + timedelta(minutes=61, microseconds=1)),
+]
+
+
+@pytest.mark.parametrize("width", [60, 300, 3600])
+@pytest.mark.parametrize("start,end", RANGES)
+def test_rollup_aggregates_match_raw(rolled_series, width, start, end):
+    _assert_same(rolled_series, width, start, end)
+
+
+def test_rollups_follow_update_and_delete(client, admin_headers, rolled_series):
+    listed = client.get("/measurements", params={"series_id": rolled_series, "limit": 50}).json()
+    first, moved, gone = listed[3], listed[20], listed[40]
+
+    r = client.patch(f"/measurements/{first['id']}", json={"value": 999.0}, headers=admin_headers)
+    assert r.status_code == 200
+    r = client.patch(
+        f"/measurements/{moved['id']}",
+        json={"timestamp": (T0 + timedelta(hours=2, minutes=5)).isoformat()},
+        headers=admin_headers,
+    )
+    assert r.status_code == 200
+    assert client.delete(f"/measurements/{gone['id']}", headers=admin_headers).status_code == 204
+
+    for width in (60, 300, 3600):
+        for start, end in RANGES:
+            _assert_same(rolled_series, width, start, end)
+    with Session(engine) as session:
+        result = aggregate(session, rolled_series, 3600, ["max", "count"])
+    assert max(result["max"]) == 999.0
+    assert sum(result["count"]) == 1599
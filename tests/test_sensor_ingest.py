@@ -0,0 +1,24 @@
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/measurements/from-sensor", "/measurements/from-sensor/batch"])
+@pytest.mark.parametrize("body", [b"{bad", b""])
+def test_malformed_json_body_is_422(client, sensor_headers, path, body):
+    r = client.post(path, content=body, headers={**sensor_headers, "Content-Type": "application/json"})
+    assert r.status_code == 422
+    details = r.json()["details"]
+    assert details[0]["type"] == "json_invalid"
+    assert details[0]["loc"][0] == "body"
+    assert "input" not in details[0]
+
+
+def test_invalid_value_is_422(client, sensor_headers):
+    r = client.post("/measurements/from-sensor", json={"value": "warm"}, headers=sensor_headers)
+    assert r.status_code == 422
+    assert r.json()["details"][0]["loc"] == ["body", "value"]
+
+
+def test_valid_reading_is_stored(client, sensor_headers):
+    r = client.post("/measurements/from-sensor", json={"value": 21.5}, headers=sensor_headers)
+    assert r.status_code == 201
+    assert r.json()["value"] == 21.5
@@ -0,0 +1,29 @@
+import time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.broker import broker
+
+
+def _subscribers(series_id):
+    return broker.stats()["subscribers"].get(series_id, 0)
+
+
+def test_ws_unknown_series_is_rejected(client):
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/series/999999/ws"):
+            pass
+    assert exc.value.code == 1008
+
+
+def test_ws_delivers_readings_and_unsubscribes_on_disconnect(client, sensor_headers):
+    with client.websocket_connect("/series/1/ws") as ws:
+        assert client.post("/measurements/from-sensor", json={"value": 22.0}, headers=sensor_headers).status_code == 201
+        assert ws.receive_json()["value"] == 22.0
+        assert _subscribers(1) == 1
+    # cicha seria - rozłączenie wykrywa zadanie odbierające
+    deadline = time.monotonic() + 5
+    while _subscribers(1) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert _subscribers(1) == 0